@@ -4,11 +4,14 @@ import math
 import random
 import requests
 import os
+import re
 import asyncio
-from typing import List, Dict
+from bisect import bisect_left
+from typing import List, Dict, Optional
 from pydantic import BaseModel
 from langchain_openai import ChatOpenAI
 import logging
+import tiktoken
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -68,7 +71,7 @@ For each SIGNIFICANT entity found add them to the show notes in this format
 - Name: Name as mentioned (or corrected if the transcript has an error)
 - Search Query: Write a VERY DETAILED google search query that I can use to search the web and retrieve the URL for the book, the research paper, wikipedia article for the person, etc. Make sure this search query is detailed and includes context on the named entity so that the search results will be specific to that entity mentioned. If necessary, use context from the conversation as well to make this search query as accurate as possible.
 - Context: Write 2 detailed sentences explaining the context of the transcript where this named entity was mentioned.
-- Timestamp: Give the timestamp from the transcript of where this is discussed
+- Timestamp: Give the timestamp in HH:MM:SS format (e.g. 01:23:45) where this entity is discussed in the transcript. Use hours even for videos under an hour (e.g. use 00:05:30 not 5:30). The transcript marks time with [seconds] anchors; convert the nearest anchor before where this is discussed
 
 Here's the transcript segment:
 {text_content}"""
@@ -155,20 +158,144 @@ def split_transcript(transcript_entries: List[dict], target_segments: int = 5) -
     
     return segments
 
+# Token-budgeted segmentation (same rules as the server's app/segmentation.py).
+# "time" keeps the equal-duration slices from calculate_target_segments;
+# "tokens" packs entries up to SEGMENT_TOKEN_BUDGET counted tokens per call
+SEGMENTATION_MODE = os.getenv('SEGMENTATION_MODE', 'time')
+SEGMENT_TOKEN_BUDGET = int(os.getenv('SEGMENT_TOKEN_BUDGET', 4000))
+SEGMENT_SNAP_TO_PAUSES = os.getenv('SEGMENT_SNAP_TO_PAUSES', 'false').lower() == 'true'
+SEGMENT_MIN_FILL = float(os.getenv('SEGMENT_MIN_FILL', 0.75))
+# "compact" renders normalized caption text with an integer [seconds] anchor
+# every PROMPT_ANCHOR_INTERVAL seconds; "full" puts the exact start before every entry
+PROMPT_FORMAT = os.getenv('PROMPT_FORMAT', 'compact')
+PROMPT_ANCHOR_INTERVAL = float(os.getenv('PROMPT_ANCHOR_INTERVAL', 30))
+_FILLER = re.compile(r"\b(?:u+h+|u+m+|e+r+m+|h+m+)\b[,.]?", re.IGNORECASE)
+_NON_SPEECH = re.compile(r"\[(?:music|\s*_+\s*)\]", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+_token_counters = {}
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    if model not in _token_counters:
+        try:
+            try:
+                encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encoding = tiktoken.get_encoding('o200k_base')
+            _token_counters[model] = lambda value: len(encoding.encode(value))
+        except Exception as e:
+            # The encoding is downloaded on first use; estimate rather than fail
+            print(f"Could not load tiktoken encoding for {model}, estimating tokens: {str(e)}")
+            _token_counters[model] = lambda value: max(1, round(len(value) / 4))
+    return _token_counters[model](text)
+
+def normalize_text(text: str) -> str:
+    """Drop filler words and non-speech tags and collapse whitespace."""
+    text = _NON_SPEECH.sub(" ", text)
+    text = _FILLER.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+def segment_text(segment: List[dict]) -> str:
+    if PROMPT_FORMAT == 'full':
+        return " ".join(f"[{entry['start']}s] {entry['text']}" for entry in segment)
+    parts = []
+    last_anchor = None
+    for entry in segment:
+        if last_anchor is None or entry['start'] - last_anchor >= PROMPT_ANCHOR_INTERVAL:
+            parts.append(f"[{int(entry['start'])}]")
+            last_anchor = entry['start']
+        text = normalize_text(entry['text'])
+        if text:
+            parts.append(text)
+    return " ".join(parts)
+
+def resolve_timestamp(seconds: float, segment: List[dict]) -> float:
+    """Exact start time of the entry in segment closest to a timestamp returned by the model."""
+    starts = [entry['start'] for entry in segment]
+    # Anchors truncate starts, so an anchor value is the first entry at or after it
+    i = bisect_left(starts, int(seconds))
+    if i < len(starts) and int(starts[i]) == int(seconds):
+        return starts[i]
+    return min(starts[max(0, i - 1):i + 1], key=lambda start: abs(start - seconds))
+
+def parse_timestamp(timestamp: str) -> Optional[float]:
+    """Seconds from an HH:MM:SS, MM:SS or plain seconds timestamp, or None if it can't be parsed."""
+    try:
+        seconds = 0.0
+        for part in timestamp.strip().strip('[]s').split(':'):
+            seconds = seconds * 60 + float(part)
+        return seconds
+    except ValueError:
+        return None
+
+def format_timestamp(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def split_by_tokens(transcript_entries: List[dict], token_budget: int = None, snap_to_pauses: bool = None, model: str = "gpt-4o-mini") -> List[List[dict]]:
+    """Pack consecutive entries into segments of at most token_budget transcript tokens."""
+    token_budget = token_budget or SEGMENT_TOKEN_BUDGET
+    snap_to_pauses = SEGMENT_SNAP_TO_PAUSES if snap_to_pauses is None else snap_to_pauses
+    min_fill = token_budget * SEGMENT_MIN_FILL
+
+    def gap_before(entries, i):
+        previous = entries[i - 1]
+        return entries[i]['start'] - (previous['start'] + previous.get('duration', 0))
+
+    anchor_tokens = count_tokens(f"[{int(transcript_entries[-1]['start'])}]", model) + 1 if transcript_entries else 0
+    last_anchor = None
+
+    segments = []
+    current, current_tokens, total = [], [], 0
+    for entry in transcript_entries:
+        if PROMPT_FORMAT == 'full':
+            tokens = count_tokens(f"[{entry['start']}s] {entry['text']}", model) + 1
+        else:
+            text = normalize_text(entry['text'])
+            tokens = count_tokens(text, model) + 1 if text else 0
+            if last_anchor is None or entry['start'] - last_anchor >= PROMPT_ANCHOR_INTERVAL:
+                tokens += anchor_tokens
+                last_anchor = entry['start']
+        if current and total + tokens > token_budget:
+            cut = len(current)
+            if snap_to_pauses:
+                # Cut at the longest pause once the segment is full enough
+                filled = 0
+                best_gap = None
+                for i in range(1, len(current)):
+                    filled += current_tokens[i - 1]
+                    if filled >= min_fill and (best_gap is None or gap_before(current, i) > best_gap):
+                        best_gap = gap_before(current, i)
+                        cut = i
+                if best_gap is not None and gap_before([current[-1], entry], 1) >= best_gap:
+                    cut = len(current)
+            segments.append(current[:cut])
+            current, current_tokens = current[cut:], current_tokens[cut:]
+            total = sum(current_tokens)
+            if current and total + tokens > token_budget:
+                segments.append(current)
+                current, current_tokens, total = [], [], 0
+        current.append(entry)
+        current_tokens.append(tokens)
+        total += tokens
+
+    if current:
+        segments.append(current)
+    return segments
+
 async def process_segment(segment: List[dict], i: int, segments: List[List[dict]], llm: ChatOpenAI) -> List[ShowNoteItem]:
     """Process a single transcript segment for deep research with NER analysis."""
     print(f"\n[Segment {i+1}] Processing...")
     
     # Convert segment to text
-    segment_text = " ".join([f"[{entry['start']}s] {entry['text']}" for entry in segment])
+    prompt = DEEP_RESEARCH_PROMPT.format(text_content=segment_text(segment))
     
     # Get insights for this segment
     chain = llm.with_structured_output(ShowNoteList)
     
     # Get OpenAI analysis
     try:
-        print("[DEBUG] Calling LLM...")
-        result = await chain.ainvoke(DEEP_RESEARCH_PROMPT.format(text_content=segment_text))
+        print(f"[DEBUG] Calling LLM with {count_tokens(prompt, 'gpt-4o')} prompt tokens...")
+        result = await chain.ainvoke(prompt)
         print(f"[DEBUG] Raw LLM result type: {type(result)}")
         print(f"[DEBUG] Raw LLM result dict: {result.dict()}")
     except Exception as e:
@@ -195,6 +322,11 @@ async def process_segment(segment: List[dict], i: int, segments: List[List[dict]
                 if selected_url:
                     note.dict()['url'] = selected_url
 
+            # Snap the model's timestamp to the start of a transcript entry in this segment
+            seconds = parse_timestamp(note.timestamp)
+            if seconds is not None:
+                note.timestamp = format_timestamp(resolve_timestamp(seconds, segment))
+
             # Print all information together
             formatted_note = f"""Name: {note.name}
 Search Query: {note.search_query}
@@ -269,8 +401,11 @@ async def _handle_async(event: Dict, context: object) -> Dict:
         print(f"Video duration: {total_duration:.2f}s, Target segments: {target_segments}")
         
         # Split transcript into segments
-        segments = split_transcript(transcript_entries, target_segments)
-        print(f"Split into {len(segments)} segments")
+        if SEGMENTATION_MODE == 'tokens':
+            segments = split_by_tokens(transcript_entries, model='gpt-4o')
+        else:
+            segments = split_transcript(transcript_entries, target_segments)
+        print(f"Split into {len(segments)} segments ({SEGMENTATION_MODE} mode)")
         
         # Initialize OpenAI client
         print("\n3. Initializing OpenAI client...")
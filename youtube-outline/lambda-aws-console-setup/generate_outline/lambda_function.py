@@ -4,14 +4,31 @@ from langchain_openai import ChatOpenAI
 import logging
 from pprint import pformat
 import asyncio
+import hashlib
 import math
 import json
+import os
+import re
+import struct
+import sys
+import zlib
 import boto3
+from array import array
+import tiktoken
+from botocore.exceptions import ClientError
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Cached outlines only change when the cache entry is replaced, so a CDN or
+# browser can keep them and revalidate with If-None-Match
+OUTLINE_CACHE_CONTROL = os.getenv('OUTLINE_CACHE_CONTROL', 'public, max-age=86400')
+
+# Bucket the get_transcript function caches transcripts in; a posted transcript
+# may only replace a cached outline if it matches the copy stored there
+TRANSCRIPT_CACHE_BUCKET = os.getenv('TRANSCRIPT_CACHE_BUCKET', 'youtube-transcripts-cache-v2')
+
 class NamedEntity(BaseModel):
     name: str    # The entity itself (e.g., "Python", "Euler's Formula", "John von Neumann")
     type: str    # The type/category (e.g., "programming_language", "theorem", "person")
@@ -77,8 +94,18 @@ class FinalizedOutlinePoint(BaseModel):
     bullet_points: List[str]
     entities: List[NamedEntity] = []
 
+class OutlineSource(BaseModel):
+    """Which transcript entries each chapter came from (same as the server's), so an appended transcript can reuse them."""
+    entries: int
+    transcript_hash: str
+    # Entry index each segment ends at (exclusive), in order
+    segment_ends: List[int]
+    # transcript_hash of the entries before the last segment
+    prefix_hash: str
+
 class FinalizedOutlineResponse(BaseModel):
     points: List[FinalizedOutlinePoint]
+    source: Optional[OutlineSource] = None
 
 def calculate_target_segments(total_duration: float) -> int:
     """
@@ -131,14 +158,186 @@ def split_transcript(transcript_entries: List[dict], target_segments: int = 5) -
     
     return segments
 
+# Token-budgeted segmentation (same rules as the server's app/segmentation.py).
+# "time" keeps the equal-duration slices from calculate_target_segments;
+# "tokens" packs entries up to SEGMENT_TOKEN_BUDGET counted tokens per call
+SEGMENTATION_MODE = os.getenv('SEGMENTATION_MODE', 'time')
+SEGMENT_TOKEN_BUDGET = int(os.getenv('SEGMENT_TOKEN_BUDGET', 4000))
+SEGMENT_SNAP_TO_PAUSES = os.getenv('SEGMENT_SNAP_TO_PAUSES', 'false').lower() == 'true'
+SEGMENT_MIN_FILL = float(os.getenv('SEGMENT_MIN_FILL', 0.75))
+# "compact" renders normalized caption text with an integer [seconds] anchor
+# every PROMPT_ANCHOR_INTERVAL seconds; "full" puts the exact start before every entry
+PROMPT_FORMAT = os.getenv('PROMPT_FORMAT', 'compact')
+PROMPT_ANCHOR_INTERVAL = float(os.getenv('PROMPT_ANCHOR_INTERVAL', 30))
+_FILLER = re.compile(r"\b(?:u+h+|u+m+|e+r+m+|h+m+)\b[,.]?", re.IGNORECASE)
+_NON_SPEECH = re.compile(r"\[(?:music|\s*_+\s*)\]", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+_token_counters = {}
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    if model not in _token_counters:
+        try:
+            try:
+                encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encoding = tiktoken.get_encoding('o200k_base')
+            _token_counters[model] = lambda value: len(encoding.encode(value))
+        except Exception as e:
+            # The encoding is downloaded on first use; estimate rather than fail
+            logger.warning(f"Could not load tiktoken encoding for {model}, estimating tokens: {str(e)}")
+            _token_counters[model] = lambda value: max(1, round(len(value) / 4))
+    return _token_counters[model](text)
+
+def normalize_text(text: str) -> str:
+    """Drop filler words and non-speech tags and collapse whitespace."""
+    text = _NON_SPEECH.sub(" ", text)
+    text = _FILLER.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+def segment_text(segment: List[dict]) -> str:
+    if PROMPT_FORMAT == 'full':
+        return " ".join(f"[{entry['start']}s] {entry['text']}" for entry in segment)
+    parts = []
+    last_anchor = None
+    for entry in segment:
+        if last_anchor is None or entry['start'] - last_anchor >= PROMPT_ANCHOR_INTERVAL:
+            parts.append(f"[{int(entry['start'])}]")
+            last_anchor = entry['start']
+        text = normalize_text(entry['text'])
+        if text:
+            parts.append(text)
+    return " ".join(parts)
+
+def split_by_tokens(transcript_entries: List[dict], token_budget: int = None, snap_to_pauses: bool = None, model: str = "gpt-4o-mini") -> List[List[dict]]:
+    """Pack consecutive entries into segments of at most token_budget transcript tokens."""
+    token_budget = token_budget or SEGMENT_TOKEN_BUDGET
+    snap_to_pauses = SEGMENT_SNAP_TO_PAUSES if snap_to_pauses is None else snap_to_pauses
+    min_fill = token_budget * SEGMENT_MIN_FILL
+
+    def gap_before(entries, i):
+        previous = entries[i - 1]
+        return entries[i]['start'] - (previous['start'] + previous.get('duration', 0))
+
+    anchor_tokens = count_tokens(f"[{int(transcript_entries[-1]['start'])}]", model) + 1 if transcript_entries else 0
+    last_anchor = None
+
+    segments = []
+    current, current_tokens, total = [], [], 0
+    for entry in transcript_entries:
+        if PROMPT_FORMAT == 'full':
+            tokens = count_tokens(f"[{entry['start']}s] {entry['text']}", model) + 1
+        else:
+            text = normalize_text(entry['text'])
+            tokens = count_tokens(text, model) + 1 if text else 0
+            if last_anchor is None or entry['start'] - last_anchor >= PROMPT_ANCHOR_INTERVAL:
+                tokens += anchor_tokens
+                last_anchor = entry['start']
+        if current and total + tokens > token_budget:
+            cut = len(current)
+            if snap_to_pauses:
+                # Cut at the longest pause once the segment is full enough
+                filled = 0
+                best_gap = None
+                for i in range(1, len(current)):
+                    filled += current_tokens[i - 1]
+                    if filled >= min_fill and (best_gap is None or gap_before(current, i) > best_gap):
+                        best_gap = gap_before(current, i)
+                        cut = i
+                if best_gap is not None and gap_before([current[-1], entry], 1) >= best_gap:
+                    cut = len(current)
+            segments.append(current[:cut])
+            current, current_tokens = current[cut:], current_tokens[cut:]
+            total = sum(current_tokens)
+            if current and total + tokens > token_budget:
+                segments.append(current)
+                current, current_tokens, total = [], [], 0
+        current.append(entry)
+        current_tokens.append(tokens)
+        total += tokens
+
+    if current:
+        segments.append(current)
+    return segments
+
+def transcript_hash(transcript_entries: List[dict]) -> str:
+    canonical = json.dumps(
+        [[entry['start'], entry.get('duration', 0), entry['text']] for entry in transcript_entries],
+        separators=(',', ':'),
+        ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def split_by_duration(transcript_entries: List[dict], segment_duration: float) -> List[List[dict]]:
+    """Split entries on a fixed grid from the first entry, so appended entries never move earlier cuts."""
+    segments = []
+    current = []
+    boundary = transcript_entries[0]['start'] + segment_duration if transcript_entries else 0
+    for entry in transcript_entries:
+        if current and entry['start'] >= boundary:
+            segments.append(current)
+            current = []
+            while entry['start'] >= boundary:
+                boundary += segment_duration
+        current.append(entry)
+    if current:
+        segments.append(current)
+    return segments
+
+def extend_segments(transcript_entries: List[dict], previous: Optional[dict]):
+    """
+    If transcript_entries extend the transcript of a previous outline, return
+    (segments, kept chapters): every segment before the previous outline's last
+    one is kept with its chapter, and only that boundary segment and the new
+    tail are re-segmented. Returns None otherwise.
+    """
+    source = (previous or {}).get('source')
+    if not source or len(source['segment_ends']) < 2 or len(transcript_entries) < source['entries']:
+        return None
+    boundary = source['segment_ends'][-2]
+    if len(previous['points']) != len(source['segment_ends']) or transcript_hash(transcript_entries[:boundary]) != source['prefix_hash']:
+        return None
+    starts = [0] + source['segment_ends'][:-2]
+    kept_segments = [transcript_entries[begin:end] for begin, end in zip(starts, source['segment_ends'][:-1])]
+    tail = transcript_entries[boundary:]
+    if SEGMENTATION_MODE == 'tokens':
+        tail_segments = split_by_tokens(tail)
+    else:
+        segment_duration = max(1.0, (tail[0]['start'] - transcript_entries[0]['start']) / len(kept_segments))
+        tail_segments = split_by_duration(tail, segment_duration)
+    kept = [FinalizedOutlinePoint(**point) for point in previous['points'][:len(kept_segments)]]
+    return kept_segments + tail_segments, kept
+
+def extends_source(transcript_entries: List[dict], source: dict) -> bool:
+    """Whether transcript_entries strictly extend the transcript an outline was built from."""
+    return (
+        len(transcript_entries) > source['entries']
+        and transcript_hash(transcript_entries[:source['entries']]) == source['transcript_hash']
+    )
+
+def outline_source(transcript_entries: List[dict], segments: List[List[dict]]) -> Optional[OutlineSource]:
+    if not segments:
+        return None
+    segment_ends = []
+    end = 0
+    for segment in segments:
+        end += len(segment)
+        segment_ends.append(end)
+    boundary = segment_ends[-2] if len(segment_ends) > 1 else 0
+    return OutlineSource(
+        entries=len(transcript_entries),
+        transcript_hash=transcript_hash(transcript_entries),
+        segment_ends=segment_ends,
+        prefix_hash=transcript_hash(transcript_entries[:boundary])
+    )
+
 async def process_segment(segment: List[dict], i: int, segments: List[List[dict]], llm: ChatOpenAI) -> FinalizedOutlinePoint:
     # Convert segment to text
-    segment_text = " ".join([f"[{entry['start']}s] {entry['text']}" for entry in segment])
+    prompt = CHAPTER_SUMMARY_PROMPT.format(text_content=segment_text(segment))
     
     # Get summary and bullet points for this segment
-    logger.info(f"Generating summary for segment {i+1}")
+    logger.info(f"Generating summary for segment {i+1} ({count_tokens(prompt)} prompt tokens)")
     chain = llm.with_structured_output(FinalizedOutlinePoint)
-    result = await chain.ainvoke(CHAPTER_SUMMARY_PROMPT.format(text_content=segment_text))
+    result = await chain.ainvoke(prompt)
     
     # Calculate duration
     start_time = segment[0]['start']
@@ -156,38 +355,54 @@ async def process_segment(segment: List[dict], i: int, segments: List[List[dict]
         entities=result.entities
     )
 
-async def generate_summary(transcript: dict):
+async def generate_summary(transcript: dict, previous: Optional[dict] = None):
+    """
+    Args:
+        transcript: Request body with the "transcript" entries
+        previous: Cached outline of an earlier version of this video's transcript;
+            if the transcript extends it, only the new tail is outlined
+    """
     try:
         logger.info("Received request to generate summary")
         transcript_entries = transcript.get('transcript', [])
         logger.info(f"Transcript received with {len(transcript_entries)} entries")
         
-        # Calculate total duration and target segments
-        if transcript_entries:
-            last_entry = transcript_entries[-1]
-            total_duration = last_entry['start'] + last_entry.get('duration', 0)
-            target_segments = calculate_target_segments(total_duration)
-            logger.info(f"Video duration: {total_duration:.2f}s, Target segments: {target_segments}")
+        extended = extend_segments(transcript_entries, previous)
+        if extended:
+            segments, kept = extended
+            logger.info(f"Transcript extends the cached outline: keeping {len(kept)} chapters, "
+                        f"outlining {len(segments) - len(kept)} new segments")
         else:
-            target_segments = 5
-        
-        # Split transcript into segments
-        segments = split_transcript(transcript_entries, target_segments)
-        logger.info(f"Split transcript into {len(segments)} segments")
+            kept = []
+            # Calculate total duration and target segments
+            if transcript_entries:
+                last_entry = transcript_entries[-1]
+                total_duration = last_entry['start'] + last_entry.get('duration', 0)
+                target_segments = calculate_target_segments(total_duration)
+                logger.info(f"Video duration: {total_duration:.2f}s, Target segments: {target_segments}")
+            else:
+                target_segments = 5
+            
+            # Split transcript into segments
+            if SEGMENTATION_MODE == 'tokens':
+                segments = split_by_tokens(transcript_entries)
+            else:
+                segments = split_transcript(transcript_entries, target_segments)
+            logger.info(f"Split transcript into {len(segments)} segments ({SEGMENTATION_MODE} mode)")
         
         llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
         
-        # Process all segments in parallel
+        # Process all new segments in parallel
         async with asyncio.TaskGroup() as tg:
             tasks = [
-                tg.create_task(process_segment(segment, i, segments, llm))
-                for i, segment in enumerate(segments)
+                tg.create_task(process_segment(segments[i], i, segments, llm))
+                for i in range(len(kept), len(segments))
             ]
         
         # Get results in order
-        finalized_points = [task.result() for task in tasks]
+        finalized_points = kept + [task.result() for task in tasks]
         
-        final_response = FinalizedOutlineResponse(points=finalized_points)
+        final_response = FinalizedOutlineResponse(points=finalized_points, source=outline_source(transcript_entries, segments))
         logger.info(f"Finalized response with summaries:\n{pformat(final_response.dict(), indent=2)}")
         return final_response
         
@@ -196,46 +411,127 @@ async def generate_summary(transcript: dict):
         logger.exception("Full traceback:")
         return None
 
-async def get_cached_outline(video_id: str) -> Optional[FinalizedOutlineResponse]:
-    """Try to get cached outline from S3"""
+async def get_cached_outline(video_id: str, if_none_match: Optional[str] = None) -> Optional[dict]:
+    """
+    Try to get cached outline from S3.
+
+    Returns {body, etag} with the stored JSON, {not_modified, etag} when
+    if_none_match still matches (S3 skips the body), or None on a miss.
+    """
     try:
         s3_client = boto3.client('s3')
         logger.info(f"Checking S3 cache for video_id: {video_id}")
         
-        response = s3_client.get_object(
-            Bucket='youtube-outline-summaries-cache',
-            Key=f'outlines/{video_id}.json'
-        )
-        data = json.loads(response['Body'].read())
+        params = {'Bucket': 'youtube-outline-summaries-cache', 'Key': f'outlines/{video_id}.json'}
+        if if_none_match:
+            params['IfNoneMatch'] = if_none_match
+        response = s3_client.get_object(**params)
         logger.info(f"Found cached outline for video_id: {video_id}")
-        return FinalizedOutlineResponse(**data)
+        return {'body': response['Body'].read().decode('utf-8'), 'etag': response['ETag']}
     except s3_client.exceptions.NoSuchKey:
         logger.info(f"No cached outline found for video_id: {video_id}")
         return None
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('304', 'NotModified'):
+            logger.info(f"Cached outline not modified for video_id: {video_id}")
+            return {'not_modified': True, 'etag': if_none_match}
+        logger.error(f"Error retrieving cached outline: {str(e)}")
+        return None
     except Exception as e:
         logger.error(f"Error retrieving cached outline: {str(e)}")
         return None
 
-async def cache_outline(video_id: str, outline: FinalizedOutlineResponse):
-    """Cache outline in S3"""
+# Binary transcript cache format, version 1 (same layout as the server's
+# app/transcript_format.py and the get_transcript function). Objects without
+# the magic are legacy {"transcript": [...]} JSON.
+TRANSCRIPT_MAGIC = b'YTT\x01'
+TRANSCRIPT_HEADER = struct.Struct('<4sBIQ')
+
+def _to_little_endian(values: array) -> array:
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+def decode_transcript(body: bytes) -> list:
+    if not body.startswith(TRANSCRIPT_MAGIC):
+        return json.loads(body.decode('utf-8'))['transcript']
+
+    _, _, count, _ = TRANSCRIPT_HEADER.unpack_from(body)
+    payload = zlib.decompress(body[TRANSCRIPT_HEADER.size:])
+
+    starts, durations, offsets = array('d'), array('d'), array('I')
+    position = 0
+    for column, length in ((starts, count), (durations, count), (offsets, count + 1)):
+        end = position + length * column.itemsize
+        column.frombytes(payload[position:end])
+        _to_little_endian(column)
+        position = end
+
+    text = payload[position:].decode('utf-8')
+    offsets = offsets.tolist()
+    return [
+        {'text': text[begin:end], 'start': start, 'duration': duration}
+        for begin, end, start, duration in zip(offsets, offsets[1:], starts.tolist(), durations.tolist())
+    ]
+
+async def matches_cached_transcript(video_id: str, transcript_entries: List[dict]) -> bool:
+    """Whether transcript_entries are the transcript get_transcript has cached for the video."""
+    try:
+        s3_client = boto3.client('s3')
+        response = s3_client.get_object(Bucket=TRANSCRIPT_CACHE_BUCKET, Key=f"{video_id}.json")
+        cached = decode_transcript(response['Body'].read())
+    except Exception as e:
+        logger.error(f"Could not read cached transcript for video_id {video_id}: {str(e)}")
+        return False
+
+    # Compare values, not JSON: a client round-trip turns 1.0 into 1
+    def entries(transcript: List[dict]) -> list:
+        return [(float(entry['start']), float(entry.get('duration', 0)), entry['text']) for entry in transcript]
+
+    return entries(cached) == entries(transcript_entries)
+
+async def cache_outline(video_id: str, body: str) -> Optional[str]:
+    """Cache outline JSON in S3 and return the stored object's ETag"""
     try:
         s3_client = boto3.client('s3')
         logger.info(f"Caching outline for video_id: {video_id}")
         
-        s3_client.put_object(
+        response = s3_client.put_object(
             Bucket='youtube-outline-summaries-cache',
             Key=f'outlines/{video_id}.json',
-            Body=json.dumps(outline.dict()),
+            Body=body,
             ContentType='application/json'
         )
         logger.info(f"Successfully cached outline for video_id: {video_id}")
+        return response.get('ETag')
     except Exception as e:
         logger.error(f"Failed to cache outline: {str(e)}")
+        return None
+
+def outline_response(body: str, etag: Optional[str]) -> dict:
+    headers = {'Content-Type': 'application/json', 'Cache-Control': OUTLINE_CACHE_CONTROL}
+    if etag:
+        headers['ETag'] = etag
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': body
+    }
+
+def not_modified_response(etag: str) -> dict:
+    return {
+        'statusCode': 304,
+        'headers': {'ETag': etag, 'Cache-Control': OUTLINE_CACHE_CONTROL}
+    }
 
 async def _handle_async(event, context):
     try:
+        # GET ?video_id=... only serves cached outlines, so it is safe for a CDN
+        is_get = event.get('requestContext', {}).get('http', {}).get('method') == 'GET'
+        if is_get:
+            body = event.get('queryStringParameters') or {}
         # Parse the event body if it's a string
-        if isinstance(event.get('body'), str):
+        elif isinstance(event.get('body'), str):
             body = json.loads(event['body'])
         else:
             body = event.get('body', event)
@@ -249,29 +545,52 @@ async def _handle_async(event, context):
                 'body': json.dumps({'error': 'video_id is required'})
             }
 
-        # Try to get cached outline
-        cached_outline = await get_cached_outline(video_id)
+        # Try to get cached outline; a matching If-None-Match is answered without the body.
+        # A request with a transcript is checked against it first, so S3 can't answer it with a 304
+        request_headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+        if_none_match = request_headers.get('if-none-match')
+        transcript_entries = body.get('transcript') if not is_get else None
+        cached_outline = await get_cached_outline(video_id, None if transcript_entries else if_none_match)
+        if cached_outline and cached_outline.get('not_modified'):
+            return not_modified_response(cached_outline['etag'])
+
+        previous = None
         if cached_outline:
+            stored = json.loads(cached_outline['body'])
+            source = stored.get('source')
+            # Outlines cached before sources were recorded are served as they are
+            if not transcript_entries or not source or source['transcript_hash'] == transcript_hash(transcript_entries):
+                if if_none_match and cached_outline['etag'] in [tag.strip() for tag in if_none_match.split(',')]:
+                    return not_modified_response(cached_outline['etag'])
+                return outline_response(cached_outline['body'], cached_outline['etag'])
+            # Captions grew since this outline (e.g. a live stream): extend it. Any other
+            # difference, or a transcript get_transcript did not serve, leaves the cached
+            # outline in place, so a request body cannot replace it or buy a new LLM run
+            if not extends_source(transcript_entries, source) or not await matches_cached_transcript(video_id, transcript_entries):
+                logger.warning(f"Transcript posted for {video_id} does not extend its cached outline's transcript, serving the cached outline")
+                return outline_response(cached_outline['body'], cached_outline['etag'])
+            logger.info(f"Cached outline for {video_id} is from {source['entries']} entries, transcript has {len(transcript_entries)}")
+            previous = stored
+
+        if is_get:
             return {
-                'statusCode': 200,
-                'body': json.dumps(cached_outline.dict())
+                'statusCode': 404,
+                'body': json.dumps({'error': 'Outline not cached'})
             }
 
-        # Generate new outline if not cached
-        result = await generate_summary(body)
+        # Generate new outline if not cached, reusing what still matches of a stale one
+        result = await generate_summary(body, previous)
         if result is None:
             return {
                 'statusCode': 500,
                 'body': json.dumps({'error': 'Failed to generate summary'})
             }
             
-        # Cache the new outline
-        await cache_outline(video_id, result)
+        # Cache the new outline; the response body is the stored object, so its ETag applies
+        response_body = json.dumps(result.dict())
+        etag = await cache_outline(video_id, response_body)
 
-        return {
-            'statusCode': 200,
-            'body': json.dumps(result.dict())
-        }
+        return outline_response(response_body, etag)
 
     except Exception as e:
         logger.error(f"Error in lambda handler: {str(e)}")
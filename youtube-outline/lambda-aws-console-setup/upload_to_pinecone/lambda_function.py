@@ -1,10 +1,35 @@
 import os
 import json
-from typing import List, Dict, Union
+from bisect import bisect_right
+from typing import List, Dict, Tuple, Union
 from langchain_openai import OpenAIEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from pinecone import Pinecone
 
+def chunk_times(transcript: List[Dict[str, Union[str, float]]], full_text: str, chunks: List[str]) -> List[Tuple[float, float]]:
+    """
+    (start, end) seconds of each chunk split from full_text, from the first to
+    the last transcript entry it overlaps
+    """
+    # Character offset at which each entry begins in full_text
+    offsets = []
+    position = 0
+    for segment in transcript:
+        offsets.append(position)
+        position += len(segment['text']) + 1
+    times = []
+    search_from = 0
+    for chunk in chunks:
+        # Overlapping chunks start after the previous chunk's start
+        begin = full_text.find(chunk, search_from)
+        if begin < 0:
+            begin = search_from
+        search_from = begin + 1
+        first = transcript[max(bisect_right(offsets, begin) - 1, 0)]
+        last = transcript[max(bisect_right(offsets, begin + len(chunk) - 1) - 1, 0)]
+        times.append((float(first['start']), float(last['start']) + float(last.get('duration', 0))))
+    return times
+
 def process_transcript(transcript: List[Dict[str, Union[str, float]]], video_id: str):
     """
     Process transcript by combining segments, splitting into chunks, and generating embeddings
@@ -18,6 +43,7 @@ def process_transcript(transcript: List[Dict[str, Union[str, float]]], video_id:
         chunk_overlap=200
     )
     chunks = text_splitter.split_text(full_text)
+    times = chunk_times(transcript, full_text, chunks)
     
     # Generate embeddings
     embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
@@ -32,7 +58,9 @@ def process_transcript(transcript: List[Dict[str, Union[str, float]]], video_id:
             'metadata': {
                 'text': chunk,
                 'video_id': video_id,
-                'chunk_index': i
+                'chunk_index': i,
+                'start': times[i][0],
+                'end': times[i][1]
             }
         })
     
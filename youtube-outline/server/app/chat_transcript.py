@@ -1,36 +1,37 @@
-from .rag.vector_db import VectorDB
-from langchain_openai import ChatOpenAI
+from typing import Any, AsyncIterator, Dict, List, Optional
+from .llm_clients import llm_clients
+from .llm_scheduler import llm_scheduler
+from .segmentation import count_tokens
+import asyncio
 import logging
 import os
-import asyncio  # Needed to run synchronous calls in an async function
+import time
 
 logger = logging.getLogger(__name__)
 
-async def generate_chat_response(message, video_id, chat_history=None):
-    """
-    Generate a response to the user's message using the video transcript as context.
-    
-    Args:
-        message: User's current message (the question)
-        video_id: YouTube video ID to search within
-        chat_history: Optional list of previous chat messages (each dict with 'role' and 'content')
-                      If not provided, defaults to an empty list.
-    """
-    if chat_history is None:
-        chat_history = []
+CHAT_MODEL = os.getenv('CHAT_MODEL', 'gpt-4o')
+CHAT_CONTEXT_CHUNKS = int(os.getenv('CHAT_CONTEXT_CHUNKS', 5))
 
-    # Get relevant transcript context
-    vector_db = VectorDB()
-    context_segments = await vector_db.search_transcript(
+async def retrieve_context(message: str, video_id: str) -> List[Dict[str, Any]]:
+    """Transcript chunks most relevant to the message (shared client, created once per process)."""
+    return await llm_clients.vector_db().search_transcript(
         query=message,
         video_id=video_id,
-        top_k=5
+        top_k=CHAT_CONTEXT_CHUNKS
     )
 
+def build_chat_prompt(message: str, context_segments: List[Dict[str, Any]], chat_history: List[dict]) -> str:
+    """
+    Prompt answering the message from the retrieved transcript chunks and the conversation so far.
 
+    Args:
+        message: User's current message (the question)
+        context_segments: Chunks returned by retrieve_context
+        chat_history: Previous chat messages (each dict with 'role' and 'content')
+    """
     # Format the transcript segments into a single string
     formatted_segments = [segment['text'] for segment in context_segments]
-        
+
     context_text = "\n".join(formatted_segments)
 
     # TODO 2: Format the conversation history.
@@ -43,7 +44,7 @@ async def generate_chat_response(message, video_id, chat_history=None):
 
     # TODO 3: Construct the prompt for GPT-4.
     # - Include the transcript context, the conversation history, and the current message.
-    prompt = f"""
+    return f"""
 You are an AI assistant that answers questions based solely on the provided YouTube transcript context and the conversation history.
 Transcript context:
 {context_text}
@@ -56,17 +57,33 @@ Current question: {message}
 Answer based only on the above context. If there is insufficient information, please indicate that (but you should still make a best attempt to answer the question).
     """.strip()
 
+async def generate_chat_response(message, video_id, chat_history=None):
+    """
+    Generate a response to the user's message using the video transcript as context.
+
+    Args:
+        message: User's current message (the question)
+        video_id: YouTube video ID to search within
+        chat_history: Optional list of previous chat messages (each dict with 'role' and 'content')
+                      If not provided, defaults to an empty list.
+    """
+    if chat_history is None:
+        chat_history = []
+
+    # Get relevant transcript context
+    context_segments = await retrieve_context(message, video_id)
+    prompt = build_chat_prompt(message, context_segments, chat_history)
+
     logger.info(f"Constructed prompt for GPT-4: {prompt}")
 
     # TODO 4: Call GPT-4 using the ChatOpenAI API.
-    # - Instantiate the LLM with the appropriate model and settings.
-    # - Because our function is async and the LLM call is blocking, we run it in a thread.
-    llm = ChatOpenAI(
-        model="gpt-4o",
-        temperature=0.7,
-        openai_api_key=os.getenv("OPENAI_API_KEY")
+    # - The shared model reuses pooled connections across chat turns.
+    llm = llm_clients.chat_model(CHAT_MODEL, temperature=0.7)
+    response = await llm_scheduler.run(
+        "chat",
+        lambda: llm.ainvoke(prompt),
+        count_tokens(prompt, CHAT_MODEL)
     )
-    response = await asyncio.to_thread(llm.invoke, prompt)
 
     # Extract the answer text from the response.
     # LangChain AIMessage objects store their content in the 'content' attribute
@@ -75,3 +92,69 @@ Answer based only on the above context. If there is insufficient information, pl
 
     # Return the generated answer
     return {"answer": answer}
+
+async def stream_chat_response(
+    message: str,
+    video_id: str,
+    chat_history: Optional[List[dict]] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Stream a response to the user's message as it is generated.
+
+    Yields {"type": "context", "chunks": [{text, score, start, end}]} once the
+    transcript chunks are retrieved, then {"type": "token", "text"} for each
+    piece of the answer, then {"type": "done", "answer", "first_token_ms",
+    "total_ms"}. Closing the iterator (e.g. when the client disconnects)
+    cancels the model call and frees its scheduler slot.
+
+    Args:
+        message: User's current message (the question)
+        video_id: YouTube video ID to search within
+        chat_history: Optional list of previous chat messages (each dict with 'role' and 'content')
+    """
+    started = time.monotonic()
+    context_segments = await retrieve_context(message, video_id)
+    yield {
+        "type": "context",
+        "chunks": [
+            {"text": segment['text'], "score": segment['score'], "start": segment.get('start'), "end": segment.get('end')}
+            for segment in context_segments
+        ]
+    }
+
+    prompt = build_chat_prompt(message, context_segments, chat_history or [])
+    llm = llm_clients.chat_model(CHAT_MODEL, temperature=0.7)
+    # The scheduler slot is held for the whole stream; tokens are handed over
+    # through a queue because run() takes a coroutine, not an iterator
+    tokens: asyncio.Queue = asyncio.Queue()
+
+    async def produce() -> None:
+        async for chunk in llm.astream(prompt):
+            if chunk.content:
+                tokens.put_nowait(chunk.content)
+
+    producer = asyncio.create_task(llm_scheduler.run("chat", produce, count_tokens(prompt, CHAT_MODEL)))
+    producer.add_done_callback(lambda _: tokens.put_nowait(None))
+    parts = []
+    first_token_ms = None
+    try:
+        while (token := await tokens.get()) is not None:
+            if first_token_ms is None:
+                first_token_ms = round((time.monotonic() - started) * 1000)
+            parts.append(token)
+            yield {"type": "token", "text": token}
+        # Surface the model call's error, if it failed
+        producer.result()
+    finally:
+        if not producer.done():
+            logger.info(f"Chat stream for video {video_id} closed early, cancelling the model call")
+            producer.cancel()
+
+    answer = "".join(parts).strip()
+    logger.info(f"Streamed answer: {answer}")
+    yield {
+        "type": "done",
+        "answer": answer,
+        "first_token_ms": first_token_ms,
+        "total_ms": round((time.monotonic() - started) * 1000)
+    }
@@ -10,6 +10,10 @@ from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
 from langchain_openai import ChatOpenAI
 
+from .segmentation import SEGMENTATION_MODE, count_tokens, resolve_timestamp, segment_text, split_by_tokens
+from .llm_clients import llm_clients
+from .llm_scheduler import llm_scheduler
+
 ANALYSIS_MESSAGES = [
     "Analyzing: {}",
     "Searching for information on: {}",
@@ -57,6 +61,8 @@ OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 if not OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY not found in environment variables")
 
+DEEP_RESEARCH_MODEL = 'gpt-4o'
+
 TRANSCRIPT_LAMBDA_URL = 'https://qczitkftpjbnvyrydrtpujruu40mxarz.lambda-url.us-east-1.on.aws'
 
 class StatusDetails(BaseModel):
@@ -101,7 +107,7 @@ For each SIGNIFICANT entity found add them to the show notes in this format
 - Name: Name as mentioned (or corrected if the transcript has an error)
 - Search Query: Write a VERY DETAILED google search query that I can use to search the web and retrieve the URL for the book, the research paper, wikipedia article for the person, etc. Make sure this search query is detailed and includes context on the named entity so that the search results will be specific to that entity mentioned. If necessary, use context from the conversation as well to make this search query as accurate as possible.
 - Context: Write 2 detailed sentences explaining the context of the transcript where this named entity was mentioned.
-- Timestamp: Give the timestamp in HH:MM:SS format (e.g. 01:23:45) where this entity is discussed in the transcript. Use hours even for videos under an hour (e.g. use 00:05:30 not 5:30). Give the timestamp from the transcript of where this is discussed
+- Timestamp: Give the timestamp in HH:MM:SS format (e.g. 01:23:45) where this entity is discussed in the transcript. Use hours even for videos under an hour (e.g. use 00:05:30 not 5:30). The transcript marks time with [seconds] anchors; convert the nearest anchor before where this is discussed
 
 Here's the transcript segment:
 {text_content}"""
@@ -148,19 +154,33 @@ async def select_best_url(urls: List[str], query: str, context: str, name: str,
 
     chain = llm.with_structured_output(UrlSelection)
     try:
-        result = await chain.ainvoke(prompt)
+        result = await llm_scheduler.run("deep_research", lambda: chain.ainvoke(prompt), count_tokens(prompt, DEEP_RESEARCH_MODEL))
         return result.selected_url
     except Exception as e:
         print(f"URL selection error: {str(e)}")
         return urls[0]  # Fallback to first URL if selection fails
 
+def parse_timestamp(timestamp: str) -> Optional[float]:
+    """Seconds from an HH:MM:SS, MM:SS or plain seconds timestamp, or None if it can't be parsed."""
+    try:
+        seconds = 0.0
+        for part in timestamp.strip().strip('[]s').split(':'):
+            seconds = seconds * 60 + float(part)
+        return seconds
+    except ValueError:
+        return None
+
+def format_timestamp(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
 def calculate_target_segments(total_duration: float) -> int:
     """Calculate number of segments based on video duration using a square root scale."""
     minutes = total_duration / 60
     return min(30, max(5, math.floor(math.sqrt(minutes) * 2)))
 
 async def split_transcript(transcript_entries: List[dict], target_segments: int = 5, websocket: WebSocket = None) -> List[List[dict]]:
-    """Split transcript into roughly equal time segments."""
+    """Split transcript into roughly equal time segments, or token-budgeted ones in "tokens" mode."""
     if websocket:
         await websocket.send_json(create_status_message(
             stage="splitting_transcript",
@@ -177,27 +197,30 @@ async def split_transcript(transcript_entries: List[dict], target_segments: int
             ))
         return []
         
-    # Calculate total duration
-    last_entry = transcript_entries[-1]
-    total_duration = last_entry['start'] + last_entry.get('duration', 0)
-    
-    # Calculate target segment duration
-    segment_duration = total_duration / target_segments
-    
-    segments = []
-    current_segment = []
-    segment_start_time = 0
-    
-    for entry in transcript_entries:
-        if entry['start'] >= segment_start_time + segment_duration:
+    if SEGMENTATION_MODE == 'tokens':
+        segments = split_by_tokens(transcript_entries, model=DEEP_RESEARCH_MODEL)
+    else:
+        # Calculate total duration
+        last_entry = transcript_entries[-1]
+        total_duration = last_entry['start'] + last_entry.get('duration', 0)
+        
+        # Calculate target segment duration
+        segment_duration = total_duration / target_segments
+        
+        segments = []
+        current_segment = []
+        segment_start_time = 0
+        
+        for entry in transcript_entries:
+            if entry['start'] >= segment_start_time + segment_duration:
+                segments.append(current_segment)
+                current_segment = []
+                segment_start_time += segment_duration
+            current_segment.append(entry)
+        
+        # Add the last segment if it has any entries
+        if current_segment:
             segments.append(current_segment)
-            current_segment = []
-            segment_start_time += segment_duration
-        current_segment.append(entry)
-    
-    # Add the last segment if it has any entries
-    if current_segment:
-        segments.append(current_segment)
     
     if websocket:
         await websocket.send_json(create_status_message(
@@ -209,7 +232,8 @@ async def split_transcript(transcript_entries: List[dict], target_segments: int
                     {
                         "start_time": segment[0]["start"],
                         "end_time": segment[-1]["start"],
-                        "word_count": sum(len(entry["text"].split()) for entry in segment)
+                        "word_count": sum(len(entry["text"].split()) for entry in segment),
+                        "tokens": count_tokens(segment_text(segment), DEEP_RESEARCH_MODEL)
                     }
                     for segment in segments
                 ]
@@ -231,20 +255,21 @@ async def process_segment(segment: List[dict], i: int, segments: List[List[dict]
     ))
     
     # Convert segment to text
-    segment_text = " ".join([f"[{entry['start']}s] {entry['text']}" for entry in segment])
+    prompt = DEEP_RESEARCH_PROMPT.format(text_content=segment_text(segment))
     
     # Get insights for this segment
     chain = llm.with_structured_output(ShowNoteList)
     
     # Get OpenAI analysis
+    prompt_tokens = count_tokens(prompt, DEEP_RESEARCH_MODEL)
     await websocket.send_json(create_status_message(
         stage="gpt_analysis",
         message=f"Analyzing segment {i+1} content...",
-        details={"segment": i+1}
+        details={"segment": i+1, "prompt_tokens": prompt_tokens}
     ))
     
     try:
-        result = await chain.ainvoke(DEEP_RESEARCH_PROMPT.format(text_content=segment_text))
+        result = await llm_scheduler.run("deep_research", lambda: chain.ainvoke(prompt), prompt_tokens)
         
         await websocket.send_json(create_status_message(
             stage="topics_found",
@@ -286,12 +311,16 @@ async def process_segment(segment: List[dict], i: int, segments: List[List[dict]
                     llm=llm
                 )
 
+            # Snap the model's timestamp to the start of a transcript entry in this segment
+            seconds = parse_timestamp(note.timestamp)
+            timestamp = format_timestamp(resolve_timestamp(seconds, segment)) if seconds is not None else note.timestamp
+
             # Create new ShowNoteItem with all data including URL
             processed_note = ShowNoteItem(
                 name=note.name,
                 search_query=note.search_query,
                 context=note.context,
-                timestamp=note.timestamp,
+                timestamp=timestamp,
                 url=selected_url
             )
             processed_notes.append(processed_note)
@@ -444,8 +473,8 @@ async def process_deep_research(url: str, websocket: WebSocket):
             print(f"[DEBUG] Server sending message: {json.dumps(message)}")
             await websocket.send_json(message)
             
-            # Initialize OpenAI client and create tasks
-            llm = ChatOpenAI(openai_api_key=OPENAI_API_KEY, model_name='gpt-4o')
+            # Shared OpenAI client; create tasks
+            llm = llm_clients.chat_model(DEEP_RESEARCH_MODEL, temperature=0.7)
             segment_tasks = [
                 process_segment(segment, i, segments, llm, websocket)
                 for i, segment in enumerate(segments)
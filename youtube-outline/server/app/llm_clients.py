@@ -0,0 +1,109 @@
+from typing import Any, Dict, Optional, Tuple
+import logging
+import os
+
+import httpx
+import openai
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from .rag.vector_db import VectorDB
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small')
+
+class LLMClients:
+    """
+    Application-scoped OpenAI and Pinecone clients.
+
+    Chat models, embeddings and the vector store are built once and share one
+    pooled httpx client (sync and async), so a chat turn, quiz or outline
+    reuses open connections instead of constructing clients and opening new
+    TLS connections per request. start() runs at app startup and close() at
+    shutdown; clients are also created on first use so scripts and
+    benchmarks work without start().
+    """
+
+    def __init__(self, max_connections: Optional[int] = None):
+        """
+        Args:
+            max_connections: Size of the OpenAI connection pool (OPENAI_MAX_CONNECTIONS, default 64)
+        """
+        self.max_connections = max_connections or int(os.getenv('OPENAI_MAX_CONNECTIONS', 64))
+        self._http_client: Optional[openai.DefaultHttpxClient] = None
+        self._http_async_client: Optional[openai.DefaultAsyncHttpxClient] = None
+        self._chat_models: Dict[Tuple[str, float], ChatOpenAI] = {}
+        self._embeddings: Optional[OpenAIEmbeddings] = None
+        self._vector_db: Optional[VectorDB] = None
+
+    def start(self) -> None:
+        """Create the pooled HTTP clients. Safe to call more than once."""
+        if self._http_async_client is not None:
+            return
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+        self._http_client = openai.DefaultHttpxClient(limits=limits)
+        self._http_async_client = openai.DefaultAsyncHttpxClient(limits=limits)
+        logger.info(f"Started shared OpenAI clients (pool={self.max_connections})")
+
+    async def close(self) -> None:
+        """Close pooled connections and drop the cached clients."""
+        if self._http_async_client is not None:
+            await self._http_async_client.aclose()
+        if self._http_client is not None:
+            self._http_client.close()
+        self._http_client = None
+        self._http_async_client = None
+        self._chat_models.clear()
+        self._embeddings = None
+        self._vector_db = None
+
+    def chat_model(self, model: str, temperature: float = 0) -> ChatOpenAI:
+        """
+        Shared chat model for a model name and temperature.
+
+        Args:
+            model: OpenAI model name
+            temperature: Sampling temperature
+
+        Returns:
+            A ChatOpenAI using the pooled connections
+        """
+        key = (model, temperature)
+        if (llm := self._chat_models.get(key)) is None:
+            self.start()
+            llm = ChatOpenAI(
+                model=model,
+                temperature=temperature,
+                openai_api_key=os.getenv("OPENAI_API_KEY"),
+                http_client=self._http_client,
+                http_async_client=self._http_async_client
+            )
+            self._chat_models[key] = llm
+        return llm
+
+    def embeddings(self) -> OpenAIEmbeddings:
+        """Shared embeddings client (EMBEDDING_MODEL) using the pooled connections."""
+        if self._embeddings is None:
+            self.start()
+            self._embeddings = OpenAIEmbeddings(
+                model=EMBEDDING_MODEL,
+                http_client=self._http_client,
+                http_async_client=self._http_async_client
+            )
+        return self._embeddings
+
+    def vector_db(self) -> VectorDB:
+        """Shared Pinecone vector store using the shared embeddings."""
+        if self._vector_db is None:
+            self._vector_db = VectorDB(embeddings=self.embeddings())
+        return self._vector_db
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "started": self._http_async_client is not None,
+            "max_connections": self.max_connections,
+            "chat_models": sorted(f"{model}@{temperature}" for model, temperature in self._chat_models)
+        }
+
+# Shared by every module that calls OpenAI or Pinecone
+llm_clients = LLMClients()
@@ -0,0 +1,310 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from collections import deque
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first: interactive endpoints ahead of batch work
+DEFAULT_PRIORITIES = {'chat': 0, 'quiz': 1, 'summary': 2, 'deep_research': 3, 'quiz_pregenerate': 4}
+DEFAULT_PRIORITY = 5
+
+def _parse_priorities(value: Optional[str]) -> Dict[str, int]:
+    """Parse LLM_PRIORITIES, e.g. "chat=0,quiz=1,summary=2"."""
+    priorities = dict(DEFAULT_PRIORITIES)
+    for item in (value or '').split(','):
+        if '=' in item:
+            endpoint, priority = item.split('=', 1)
+            priorities[endpoint.strip()] = int(priority)
+    return priorities
+
+class _EndpointStats:
+    def __init__(self):
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.queued = 0
+        self.running = 0
+        self.tokens = 0
+        self.max_wait = 0.0
+        self.waits: deque = deque(maxlen=1000)  # Recent queue waits in seconds
+        self.latencies: deque = deque(maxlen=1000)  # Recent successful call durations in seconds
+        self.hedgeable = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.primary_wins = 0
+        self.hedges_skipped = 0
+        self.hedge_tokens = 0
+
+    def latency_percentile(self, p: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        waits = sorted(self.waits)
+
+        def percentile(p: float) -> float:
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 1) if waits else 0.0
+
+        def latency_ms(p: float) -> float:
+            latency = self.latency_percentile(p)
+            return round(latency * 1000, 1) if latency is not None else 0.0
+
+        return {
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "queued": self.queued,
+            "running": self.running,
+            "tokens": self.tokens,
+            "wait_ms_p50": percentile(0.5),
+            "wait_ms_p95": percentile(0.95),
+            "wait_ms_max": round(self.max_wait * 1000, 1),
+            "latency_ms_p50": latency_ms(0.5),
+            "latency_ms_p99": latency_ms(0.99),
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "primary_wins_after_hedge": self.primary_wins,
+            "hedges_skipped_over_budget": self.hedges_skipped,
+            "hedge_tokens": self.hedge_tokens
+        }
+
+class LLMScheduler:
+    """
+    Process-wide admission control for OpenAI calls.
+
+    Every LLM call goes through run(), which waits until a concurrency slot,
+    a request from the requests-per-minute bucket and enough tokens from the
+    tokens-per-minute bucket are all available. Waiting calls are admitted by
+    endpoint priority, first come first served within a priority.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: Optional[int] = None,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        priorities: Optional[Dict[str, int]] = None
+    ):
+        """
+        Args:
+            max_concurrent: Calls in flight at once (LLM_MAX_CONCURRENT, default 16)
+            requests_per_minute: Call budget (LLM_REQUESTS_PER_MINUTE, default 500)
+            tokens_per_minute: Prompt plus expected output tokens (LLM_TOKENS_PER_MINUTE, default 200000)
+            priorities: Endpoint -> priority, lower first (LLM_PRIORITIES, e.g. "chat=0,summary=2")
+        """
+        self.max_concurrent = max_concurrent or int(os.getenv('LLM_MAX_CONCURRENT', 16))
+        self.requests_per_minute = requests_per_minute or float(os.getenv('LLM_REQUESTS_PER_MINUTE', 500))
+        self.tokens_per_minute = tokens_per_minute or float(os.getenv('LLM_TOKENS_PER_MINUTE', 200000))
+        self.priorities = priorities or _parse_priorities(os.getenv('LLM_PRIORITIES'))
+        # Output tokens are not known up front; charge this much per call on top of the prompt
+        self.expected_output_tokens = int(os.getenv('LLM_EXPECTED_OUTPUT_TOKENS', 500))
+        # Request hedging for run_hedged(): duplicate a call still running past
+        # this percentile of the endpoint's observed latency, for at most
+        # hedge_max_fraction of its calls
+        self.hedging = os.getenv('LLM_HEDGING', 'false').lower() == 'true'
+        self.hedge_percentile = float(os.getenv('LLM_HEDGE_PERCENTILE', 0.95))
+        self.hedge_min_samples = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', 20))
+        self.hedge_max_fraction = float(os.getenv('LLM_HEDGE_MAX_FRACTION', 0.05))
+        self._queue: List[tuple] = []  # (priority, seq, future, cost)
+        self._seq = itertools.count()
+        self._request_bucket = self.requests_per_minute
+        self._token_bucket = self.tokens_per_minute
+        self._refilled_at = time.monotonic()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.running = 0
+        self.throttled = 0
+        self._endpoints: Dict[str, _EndpointStats] = {}
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        self._request_bucket = min(self.requests_per_minute, self._request_bucket + elapsed * self.requests_per_minute / 60)
+        self._token_bucket = min(self.tokens_per_minute, self._token_bucket + elapsed * self.tokens_per_minute / 60)
+
+    def _dispatch(self) -> None:
+        """Admit queued calls, highest priority first, while capacity allows."""
+        self._timer = None
+        self._refill()
+        while self._queue and self.running < self.max_concurrent:
+            priority, seq, future, cost = self._queue[0]
+            if future.done():
+                # Waiter was cancelled while queued
+                heapq.heappop(self._queue)
+                continue
+            if self._request_bucket < 1 or self._token_bucket < cost:
+                # Head of the queue waits for the buckets; later calls wait behind it
+                self.throttled += 1
+                delay = max(
+                    (1 - self._request_bucket) * 60 / self.requests_per_minute,
+                    (cost - self._token_bucket) * 60 / self.tokens_per_minute
+                )
+                self._timer = asyncio.get_running_loop().call_later(max(delay, 0.01), self._dispatch)
+                return
+            heapq.heappop(self._queue)
+            self._request_bucket -= 1
+            self._token_bucket -= cost
+            self.running += 1
+            future.set_result(None)
+
+    def _release(self) -> None:
+        self.running -= 1
+        if self._timer is None:
+            self._dispatch()
+
+    async def run(
+        self,
+        endpoint: str,
+        fn: Callable[[], Awaitable[Any]],
+        prompt_tokens: int = 0,
+        timeout: Optional[float] = None,
+        admitted: Optional[asyncio.Future] = None
+    ) -> Any:
+        """
+        Run one LLM call once the scheduler admits it.
+
+        Args:
+            endpoint: Caller name, used for priority and metrics (e.g. "summary")
+            fn: Zero-argument coroutine function making the call
+            prompt_tokens: Prompt size, charged against the tokens-per-minute budget
+            timeout: Seconds allowed for fn once admitted; time spent queued does not count
+            admitted: Future resolved when the call is admitted (used by run_hedged)
+
+        Returns:
+            The result of fn
+
+        Raises:
+            TimeoutError: If fn exceeds timeout
+        """
+        stats = self._endpoints.setdefault(endpoint, _EndpointStats())
+        # A single call larger than the whole budget is charged the whole budget
+        cost = min(prompt_tokens + self.expected_output_tokens, self.tokens_per_minute)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (self.priorities.get(endpoint, DEFAULT_PRIORITY), next(self._seq), future, cost))
+        stats.submitted += 1
+        stats.queued += 1
+        enqueued_at = time.monotonic()
+        if self._timer is None:
+            self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            stats.cancelled += 1
+            if future.done() and not future.cancelled():
+                # Admitted just as we were cancelled: hand the slot back
+                self._release()
+            raise
+        finally:
+            stats.queued -= 1
+
+        wait = time.monotonic() - enqueued_at
+        stats.waits.append(wait)
+        stats.max_wait = max(stats.max_wait, wait)
+        stats.tokens += cost
+        stats.running += 1
+        if admitted is not None and not admitted.done():
+            admitted.set_result(None)
+        started_at = time.monotonic()
+        try:
+            async with asyncio.timeout(timeout):
+                result = await fn()
+            stats.completed += 1
+            stats.latencies.append(time.monotonic() - started_at)
+            return result
+        except Exception:
+            stats.failed += 1
+            raise
+        finally:
+            stats.running -= 1
+            self._release()
+
+    def _hedge_delay(self, stats: _EndpointStats) -> Optional[float]:
+        if not self.hedging or len(stats.latencies) < self.hedge_min_samples:
+            return None
+        return stats.latency_percentile(self.hedge_percentile)
+
+    async def run_hedged(
+        self,
+        endpoint: str,
+        fn: Callable[[], Awaitable[Any]],
+        prompt_tokens: int = 0,
+        timeout: Optional[float] = None
+    ) -> Any:
+        """
+        Like run(), but if the call is still running after the endpoint's
+        hedge_percentile latency, start a duplicate and return whichever
+        succeeds first; the other one is cancelled.
+
+        Hedges go through the same admission limits as any other call and are
+        capped at hedge_max_fraction of the endpoint's hedgeable calls. With
+        hedging disabled (LLM_HEDGING) or too few latency samples this is run().
+        """
+        stats = self._endpoints.setdefault(endpoint, _EndpointStats())
+        delay = self._hedge_delay(stats)
+        if delay is None:
+            return await self.run(endpoint, fn, prompt_tokens, timeout)
+
+        stats.hedgeable += 1
+        admitted = asyncio.get_running_loop().create_future()
+        primary = asyncio.create_task(self.run(endpoint, fn, prompt_tokens, timeout, admitted))
+        pending = {primary}
+        try:
+            # Time spent queued is not latency: start the hedge timer on admission
+            await asyncio.wait({primary, admitted}, return_when=asyncio.FIRST_COMPLETED)
+            if not primary.done():
+                await asyncio.wait({primary}, timeout=delay)
+            if primary.done():
+                return primary.result()
+
+            if stats.hedges + 1 > self.hedge_max_fraction * stats.hedgeable:
+                stats.hedges_skipped += 1
+                return await primary
+
+            logger.info(f"Hedging {endpoint} call after {delay:.2f}s")
+            stats.hedges += 1
+            stats.hedge_tokens += prompt_tokens + self.expected_output_tokens
+            hedge = asyncio.create_task(self.run(endpoint, fn, prompt_tokens, timeout))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            stats.hedge_wins += 1
+                        else:
+                            stats.primary_wins += 1
+                        return task.result()
+            # Both failed: surface the primary's error
+            return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            if not admitted.done():
+                admitted.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        self._refill()
+        return {
+            "max_concurrent": self.max_concurrent,
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "running": self.running,
+            "queue_depth": sum(1 for _, _, future, _ in self._queue if not future.done()),
+            "throttled": self.throttled,
+            "available_requests": int(self._request_bucket),
+            "available_tokens": int(self._token_bucket),
+            "hedging": self.hedging,
+            "endpoints": {endpoint: stats.snapshot() for endpoint, stats in self._endpoints.items()}
+        }
+
+# Shared by every module that calls OpenAI
+llm_scheduler = LLMScheduler()
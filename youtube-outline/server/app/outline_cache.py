@@ -0,0 +1,291 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import hashlib
+import json
+import logging
+import os
+import time
+
+from .segmentation import transcript_hash
+from .single_flight import SingleFlight
+from .summary_generator import FinalizedOutlinePoint, FinalizedOutlineResponse, OUTLINE_VERSION, CHAPTER_PROMPT_VERSION
+from .transcript_cache import S3TranscriptCache, TranscriptLRU
+
+logger = logging.getLogger(__name__)
+
+def llm_calls(points: List[FinalizedOutlinePoint]) -> int:
+    """One LLM call per chapter, merged chapters included."""
+    return sum(1 + llm_calls(point.children) for point in points)
+
+def is_partial(outline: FinalizedOutlineResponse) -> bool:
+    return bool(outline.failed_segments or outline.failed_merges)
+
+class SegmentCache:
+    """
+    Memoizes single chapter results by the exact segment text.
+
+    Keys are hashes of CHAPTER_PROMPT_VERSION (model and chapter prompt) plus
+    the rendered segment text, stored under segments/{version}/{hash}.json,
+    so when a transcript or its segmentation changes only the segments whose
+    text changed go back to the LLM. With another prefix and version the same
+    cache memoizes merged chapters by the rendered chapters they merge.
+    """
+
+    def __init__(
+        self,
+        store: S3TranscriptCache,
+        max_bytes: Optional[int] = None,
+        prefix: str = "segments",
+        version: str = CHAPTER_PROMPT_VERSION
+    ):
+        """
+        Args:
+            store: S3 tier (shares the transcript cache's connection pool)
+            max_bytes: Memory tier byte budget (SEGMENT_LRU_MAX_BYTES, default 16MB)
+            prefix: Key prefix in the bucket
+            version: Prompt version the cached results depend on
+        """
+        self.store = store
+        self.prefix = prefix
+        self.version = version
+        self._memory = TranscriptLRU(
+            max_bytes=max_bytes or int(os.getenv('SEGMENT_LRU_MAX_BYTES', 16 * 1024 * 1024)),
+            ttl=float(os.getenv('OUTLINE_LRU_TTL', 24 * 3600))
+        )
+        self.memory_hits = 0
+        self.s3_hits = 0
+        self.misses = 0
+        self.stored = 0
+
+    def _key(self, text_content: str) -> str:
+        content_hash = hashlib.sha256(f"{self.version}\n{text_content}".encode('utf-8')).hexdigest()
+        return f"{self.prefix}/{self.version}/{content_hash}.json"
+
+    async def get(self, text_content: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns:
+            The cached {text, bullet_points, entities} chapter, or None
+        """
+        key = self._key(text_content)
+        body = self._memory.get(key)
+        if body is not None:
+            self.memory_hits += 1
+            return json.loads(body)
+        try:
+            body = await self.store.get(key)
+        except Exception as e:
+            logger.error(f"S3 error getting cached segment: {str(e)}")
+            body = None
+        if body is None:
+            self.misses += 1
+            return None
+        self.s3_hits += 1
+        self._memory.put(key, body, len(body))
+        return json.loads(body)
+
+    async def put(self, text_content: str, chapter: Dict[str, Any]) -> None:
+        key = self._key(text_content)
+        body = json.dumps(chapter).encode('utf-8')
+        self._memory.put(key, body, len(body))
+        self.stored += 1
+        try:
+            await self.store.put(key, body)
+        except Exception as e:
+            logger.error(f"Error caching segment: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        reused = self.memory_hits + self.s3_hits
+        lookups = reused + self.misses
+        return {
+            "version": self.version,
+            "reused": reused,
+            "memory_hits": self.memory_hits,
+            "s3_hits": self.s3_hits,
+            "generated": self.misses,
+            "stored": self.stored,
+            "reuse_rate": round(reused / lookups, 4) if lookups else 0.0,
+            "memory": self._memory.stats()
+        }
+
+class OutlineCache:
+    """
+    Content-addressed outline cache with an in-process tier and an S3 tier.
+
+    Outlines are keyed by transcript hash plus OUTLINE_VERSION (prompt, model
+    and pipeline version) and stored under outlines/{version}/{hash}.json.
+    Concurrent misses for the same key share one generation run. Outlines
+    stored with a video ID are also pointed to from
+    outlines/{version}/videos/{video_id}.json, so a later, longer transcript
+    of the same video can extend the latest one instead of starting over.
+    """
+
+    def __init__(self, store: S3TranscriptCache, max_bytes: Optional[int] = None):
+        """
+        Args:
+            store: S3 tier (shares the transcript cache's connection pool)
+            max_bytes: Memory tier byte budget (OUTLINE_LRU_MAX_BYTES, default 16MB)
+        """
+        self.store = store
+        self._memory = TranscriptLRU(
+            max_bytes=max_bytes or int(os.getenv('OUTLINE_LRU_MAX_BYTES', 16 * 1024 * 1024)),
+            ttl=float(os.getenv('OUTLINE_LRU_TTL', 24 * 3600))
+        )
+        self._generations = SingleFlight("outline_generation")
+        self.memory_hits = 0
+        self.s3_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.generated = 0
+        self.llm_calls_made = 0
+        self.llm_calls_saved = 0
+        self.previous_found = 0
+
+    @staticmethod
+    def _key(content_hash: str) -> str:
+        return f"outlines/{OUTLINE_VERSION}/{content_hash}.json"
+
+    @staticmethod
+    def _video_key(video_id: str) -> str:
+        return f"outlines/{OUTLINE_VERSION}/videos/{video_id}.json"
+
+    async def _get(self, key: str) -> Optional[FinalizedOutlineResponse]:
+        body = self._memory.get(key)
+        if body is not None:
+            self.memory_hits += 1
+        else:
+            try:
+                body = await self.store.get(key)
+            except Exception as e:
+                logger.error(f"S3 error getting cached outline: {str(e)}")
+                return None
+            if body is None:
+                return None
+            self.s3_hits += 1
+            self._memory.put(key, body, len(body))
+        outline = FinalizedOutlineResponse(**json.loads(body))
+        self.llm_calls_saved += llm_calls(outline.points)
+        return outline
+
+    async def _put(self, key: str, outline: FinalizedOutlineResponse, video_id: Optional[str] = None) -> None:
+        body = json.dumps({**outline.dict(), 'cached_at': int(time.time())}).encode('utf-8')
+        self._memory.put(key, body, len(body))
+        try:
+            await self.store.put(key, body)
+            if video_id:
+                pointer = json.dumps({'key': key}).encode('utf-8')
+                self._memory.put(self._video_key(video_id), pointer, len(pointer))
+                await self.store.put(self._video_key(video_id), pointer)
+        except Exception as e:
+            logger.error(f"Error caching outline: {str(e)}")
+
+    async def _read(self, key: str) -> Optional[bytes]:
+        body = self._memory.get(key)
+        if body is None:
+            body = await self.store.get(key)
+            if body is not None:
+                self._memory.put(key, body, len(body))
+        return body
+
+    async def find(self, transcript_entries: List[dict]) -> Optional[FinalizedOutlineResponse]:
+        """Cached outline for these entries for other features to build on; not counted in the outline stats."""
+        try:
+            body = await self._read(self._key(transcript_hash(transcript_entries)))
+        except Exception as e:
+            logger.error(f"S3 error finding cached outline: {str(e)}")
+            return None
+        return FinalizedOutlineResponse(**json.loads(body)) if body is not None else None
+
+    async def previous(self, video_id: str) -> Optional[FinalizedOutlineResponse]:
+        """Latest complete outline stored for video_id, whatever transcript it was generated from."""
+        try:
+            pointer = await self._read(self._video_key(video_id))
+            body = await self._read(json.loads(pointer)['key']) if pointer is not None else None
+        except Exception as e:
+            logger.error(f"Error getting previous outline for {video_id}: {str(e)}")
+            return None
+        if body is None:
+            return None
+        self.previous_found += 1
+        return FinalizedOutlineResponse(**json.loads(body))
+
+    async def get(self, transcript_entries: List[dict]) -> Optional[FinalizedOutlineResponse]:
+        """Cached outline for these transcript entries, without generating on a miss."""
+        key = self._key(transcript_hash(transcript_entries))
+        outline = await self._get(key)
+        if outline is None:
+            self.misses += 1
+        return outline
+
+    async def put(
+        self,
+        transcript_entries: List[dict],
+        outline: FinalizedOutlineResponse,
+        video_id: Optional[str] = None
+    ) -> None:
+        """Store an outline generated outside get_or_generate (e.g. streamed)."""
+        self.generated += 1
+        self.llm_calls_made += llm_calls(outline.points)
+        if not is_partial(outline):
+            await self._put(self._key(transcript_hash(transcript_entries)), outline, video_id)
+
+    async def get_or_generate(
+        self,
+        transcript_entries: List[dict],
+        generate: Callable[[], Awaitable[FinalizedOutlineResponse]],
+        video_id: Optional[str] = None
+    ) -> FinalizedOutlineResponse:
+        """
+        Return the cached outline for these transcript entries, generating it once on a miss.
+
+        Args:
+            transcript_entries: Transcript the outline is generated from
+            generate: Zero-argument coroutine function that runs the LLM pipeline
+            video_id: Video the transcript belongs to, recorded as its latest outline
+
+        Returns:
+            The outline
+        """
+        key = self._key(transcript_hash(transcript_entries))
+        if (outline := await self._get(key)) is not None:
+            logger.info(f"Outline cache hit for {key}")
+            return outline
+
+        self.misses += 1
+        started_here = False
+
+        async def run() -> FinalizedOutlineResponse:
+            nonlocal started_here
+            # A run that finished while we were checking S3 has already stored it
+            if (body := self._memory.get(key)) is not None:
+                return FinalizedOutlineResponse(**json.loads(body))
+            started_here = True
+            outline = await generate()
+            self.generated += 1
+            self.llm_calls_made += llm_calls(outline.points)
+            # Partial outlines are not cached: the next request retries the
+            # failed segments and merges, reusing the rest from the segment caches
+            if not is_partial(outline):
+                await self._put(key, outline, video_id)
+            return outline
+
+        outline = await self._generations.do(key, run)
+        if not started_here:
+            self.coalesced += 1
+            self.llm_calls_saved += llm_calls(outline.points)
+        return outline
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.s3_hits
+        lookups = hits + self.misses
+        return {
+            "version": OUTLINE_VERSION,
+            "memory_hits": self.memory_hits,
+            "s3_hits": self.s3_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            "generated": self.generated,
+            "llm_calls_made": self.llm_calls_made,
+            "llm_calls_saved": self.llm_calls_saved,
+            "previous_found": self.previous_found,
+            "memory": self._memory.stats()
+        }
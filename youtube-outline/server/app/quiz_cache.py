@@ -0,0 +1,209 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+
+from .quiz_generator import QUIZ_VERSION
+from .segmentation import transcript_hash
+from .summary_generator import FinalizedOutlinePoint
+from .single_flight import SingleFlight
+from .transcript_cache import S3TranscriptCache, TranscriptLRU
+
+logger = logging.getLogger(__name__)
+
+# Cache source of quizzes built from the transcript itself
+TRANSCRIPT_SOURCE = "transcript"
+
+def outline_source(points: List[FinalizedOutlinePoint]) -> str:
+    """Cache source of quizzes built from these outline chapters."""
+    canonical = json.dumps([point.dict() for point in points], sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return f"outline-{hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]}"
+
+class QuizCache:
+    """
+    Quiz cache with an in-process tier and an S3 tier.
+
+    Quizzes are keyed by transcript hash, source (TRANSCRIPT_SOURCE or
+    outline_source() of the chapters they were built from), question count,
+    difficulty and QUIZ_VERSION (prompts, model and quiz settings), stored under
+    quizzes/{version}/{hash}-{source}-{count}-{difficulty}.json. Only quizzes
+    built from the transcript or from the server's own cached outline belong
+    here; callers must not cache quizzes built from client-supplied input.
+    Concurrent misses for
+    the same key share one generation run, and pregenerate() fills the cache
+    in the background at low scheduler priority so the first request for a
+    quiz is a hit.
+    """
+
+    def __init__(self, store: S3TranscriptCache, max_bytes: Optional[int] = None):
+        """
+        Args:
+            store: S3 tier (shares the transcript cache's connection pool)
+            max_bytes: Memory tier byte budget (QUIZ_LRU_MAX_BYTES, default 8MB)
+        """
+        self.store = store
+        self._memory = TranscriptLRU(
+            max_bytes=max_bytes or int(os.getenv('QUIZ_LRU_MAX_BYTES', 8 * 1024 * 1024)),
+            ttl=float(os.getenv('QUIZ_LRU_TTL', 24 * 3600))
+        )
+        self._generations = SingleFlight("quiz_generation")
+        # Background pre-generation: on/off, and how many may be queued or running at once
+        self.pregenerate_enabled = os.getenv('QUIZ_PREGENERATE', 'true').lower() == 'true'
+        self.pregenerate_max_pending = int(os.getenv('QUIZ_PREGENERATE_MAX_PENDING', 32))
+        self._background: Set[asyncio.Task] = set()
+        self.memory_hits = 0
+        self.s3_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.generated = 0
+        self.pregenerated = 0
+        self.pregenerate_skipped = 0
+        self.pregenerate_failed = 0
+
+    @staticmethod
+    def _key(content_hash: str, source: str, num_questions: int, difficulty: str) -> str:
+        return f"quizzes/{QUIZ_VERSION}/{content_hash}-{source}-{num_questions}-{difficulty}.json"
+
+    async def _get(self, key: str, count: bool = True) -> Optional[Dict[str, Any]]:
+        body = self._memory.get(key)
+        if body is not None:
+            self.memory_hits += count
+            return json.loads(body)
+        try:
+            body = await self.store.get(key)
+        except Exception as e:
+            logger.error(f"S3 error getting cached quiz: {str(e)}")
+            return None
+        if body is None:
+            return None
+        self.s3_hits += count
+        self._memory.put(key, body, len(body))
+        return json.loads(body)
+
+    async def _put(self, key: str, quiz: Dict[str, Any]) -> None:
+        body = json.dumps({**quiz, 'cached_at': int(time.time())}).encode('utf-8')
+        self._memory.put(key, body, len(body))
+        try:
+            await self.store.put(key, body)
+        except Exception as e:
+            logger.error(f"Error caching quiz: {str(e)}")
+
+    async def _generate(
+        self,
+        key: str,
+        num_questions: int,
+        generate: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        started_here = False
+
+        async def run() -> Dict[str, Any]:
+            nonlocal started_here
+            # A run that finished while we were checking S3 has already stored it
+            if (body := self._memory.get(key)) is not None:
+                return json.loads(body)
+            started_here = True
+            quiz = await generate()
+            self.generated += 1
+            # Short quizzes are not cached, so the next request tries again
+            if len(quiz['questions']) >= num_questions:
+                await self._put(key, quiz)
+            return quiz
+
+        quiz = await self._generations.do(key, run)
+        if not started_here:
+            self.coalesced += 1
+        return quiz
+
+    async def get_or_generate(
+        self,
+        transcript_entries: List[dict],
+        source: str,
+        num_questions: int,
+        difficulty: str,
+        generate: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """
+        Return the cached quiz for these transcript entries, generating it once on a miss.
+
+        Args:
+            transcript_entries: Transcript the quiz is for
+            source: What generate builds the quiz from (TRANSCRIPT_SOURCE or outline_source())
+            num_questions: Questions asked for
+            difficulty: Difficulty asked for
+            generate: Zero-argument coroutine function returning {"questions": [...], ...}
+
+        Returns:
+            The quiz
+        """
+        key = self._key(transcript_hash(transcript_entries), source, num_questions, difficulty)
+        if (quiz := await self._get(key)) is not None:
+            logger.info(f"Quiz cache hit for {key}")
+            return quiz
+        self.misses += 1
+        return await self._generate(key, num_questions, generate)
+
+    def pregenerate(
+        self,
+        transcript_entries: List[dict],
+        source: str,
+        num_questions: int,
+        difficulty: str,
+        generate: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> None:
+        """Generate and cache a quiz in the background unless it is already cached (arguments as get_or_generate)."""
+        if not self.pregenerate_enabled or not transcript_entries:
+            return
+        if len(self._background) >= self.pregenerate_max_pending:
+            self.pregenerate_skipped += 1
+            return
+        key = self._key(transcript_hash(transcript_entries), source, num_questions, difficulty)
+
+        async def run() -> None:
+            try:
+                if await self._get(key, count=False) is None:
+                    await self._generate(key, num_questions, generate)
+                    self.pregenerated += 1
+            except Exception as e:
+                self.pregenerate_failed += 1
+                logger.error(f"Quiz pre-generation failed for {key}: {str(e)}")
+
+        task = asyncio.create_task(run())
+        # Keep a reference so the task is not garbage collected mid-run
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def close(self, timeout: float) -> None:
+        """
+        Wait up to timeout seconds for background pre-generations, then cancel the rest.
+
+        Called at shutdown, before the S3 client they write through is closed.
+        """
+        if not self._background:
+            return
+        _, pending = await asyncio.wait(set(self._background), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.info(f"Cancelled {len(pending)} quiz pre-generations at shutdown")
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.s3_hits
+        lookups = hits + self.misses
+        return {
+            "version": QUIZ_VERSION,
+            "memory_hits": self.memory_hits,
+            "s3_hits": self.s3_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            "generated": self.generated,
+            "pregenerated": self.pregenerated,
+            "pregenerate_pending": len(self._background),
+            "pregenerate_skipped": self.pregenerate_skipped,
+            "pregenerate_failed": self.pregenerate_failed,
+            "memory": self._memory.stats()
+        }
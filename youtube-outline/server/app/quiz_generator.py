@@ -1,22 +1,67 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from pydantic import BaseModel
 import logging
 from langchain_openai import ChatOpenAI
 import math
 import asyncio
+import hashlib
+import json
+import os
+import re
+
+from .llm_clients import llm_clients
+from .llm_scheduler import llm_scheduler
+from .segmentation import count_tokens, segment_text, split_by_tokens
+from .summary_generator import FinalizedOutlinePoint, chapters_text, leaf_chapters
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+QUIZ_MODEL = "gpt-4o-mini"
+
+# "structured" asks for all questions in as few schema-validated calls as the
+# transcript allows; "segments" is one free-form call per fifth of the transcript
+QUIZ_MODE = os.getenv('QUIZ_MODE', 'structured')
+QUIZ_NUM_QUESTIONS = int(os.getenv('QUIZ_NUM_QUESTIONS', 5))
+QUIZ_MAX_QUESTIONS = int(os.getenv('QUIZ_MAX_QUESTIONS', 50))
+# Transcript tokens per structured call; longer transcripts are split into batches
+QUIZ_TOKEN_BUDGET = int(os.getenv('QUIZ_TOKEN_BUDGET', 12000))
+# Follow-up calls per batch asking only for replacements of invalid or missing questions
+QUIZ_MAX_REASKS = int(os.getenv('QUIZ_MAX_REASKS', 1))
+# "outline" builds structured prompts from the video's outline chapters when
+# one is available, a fraction of the transcript's tokens; "transcript" always
+# uses the transcript
+QUIZ_SOURCE = os.getenv('QUIZ_SOURCE', 'outline')
+
+# What each difficulty asks of the questions (structured mode)
+QUIZ_DIFFICULTIES = {
+    'easy': "Keep the questions easy: they should check recall of facts and ideas stated directly in the video.",
+    'medium': "The questions should test understanding of the key concepts, not just recall of wording.",
+    'hard': "Make the questions hard: they should require applying, comparing or reasoning about the ideas, with plausible wrong options."
+}
+QUIZ_DEFAULT_DIFFICULTY = 'medium'
+
 class QuizQuestion(BaseModel):
     id: int
     question: str
     options: List[str]
     correctAnswer: int
 
+class QuizItem(BaseModel):
+    question: str
+    options: List[str]
+    correctAnswer: int  # Index of the correct option (0-3)
+
+class QuizBatch(BaseModel):
+    questions: List[QuizItem]
+
 class QuizGenerationRequest(BaseModel):
     transcript: List[Dict[str, Any]]
+    num_questions: int = QUIZ_NUM_QUESTIONS
+    difficulty: str = QUIZ_DEFAULT_DIFFICULTY
+    # Outline chapters to build the questions from instead of the transcript
+    chapters: Optional[List[FinalizedOutlinePoint]] = None
     
     def split_transcript(self) -> List[List[Dict[str, Any]]]:
         """Split the transcript into 5 roughly equal segments."""
@@ -34,7 +79,7 @@ class QuizGenerationRequest(BaseModel):
                 
         return segments
 
-async def generate_questions_for_segment(llm: ChatOpenAI, segment: List[Dict[str, Any]], start_id: int) -> List[QuizQuestion]:
+async def generate_questions_for_segment(llm: ChatOpenAI, segment: List[Dict[str, Any]], start_id: int, endpoint: str = "quiz") -> List[QuizQuestion]:
     """
     Generate questions for a single transcript segment.
     
@@ -42,6 +87,7 @@ async def generate_questions_for_segment(llm: ChatOpenAI, segment: List[Dict[str
         llm: The language model to use
         segment: List of transcript entries for this segment
         start_id: Starting ID for questions from this segment
+        endpoint: LLM scheduler endpoint the call is charged to
         
     Returns:
         List[QuizQuestion]: List of generated questions for this segment
@@ -68,12 +114,14 @@ async def generate_questions_for_segment(llm: ChatOpenAI, segment: List[Dict[str
         """
         
         # Get response from GPT
-        response = await llm.ainvoke(prompt)
+        response = await llm_scheduler.run(endpoint, lambda: llm.ainvoke(prompt), count_tokens(prompt))
         response_content = response.content
         
         try:
-            # Parse response into question object
-            question_data = eval(response_content)  # Safe since we control the input format
+            # Parse response into question object; the reply may wrap the JSON in
+            # a code fence or keep the comment from the format example
+            match = re.search(r"\{.*\}", response_content, re.DOTALL)
+            question_data = json.loads(re.sub(r"//[^\n]*", "", match.group(0) if match else response_content))
             question = QuizQuestion(
                 id=start_id,
                 question=question_data["question"],
@@ -90,18 +138,196 @@ async def generate_questions_for_segment(llm: ChatOpenAI, segment: List[Dict[str
         logger.error(f"Error generating questions for segment {start_id}: {str(e)}")
         return []
 
-async def generate_quiz_questions(request: QuizGenerationRequest) -> List[QuizQuestion]:
+STRUCTURED_QUIZ_PROMPT = """Based on the following video {material}, generate exactly {count} multiple choice questions. Each question must have exactly 4 options.
+
+{difficulty} Spread the questions across the whole video rather than only its beginning. Ensure the options are clear and distinct, and give the index (0-3) of the correct option as correctAnswer.
+
+{heading}:
+{text_content}
+"""
+
+REASK_QUIZ_PROMPT = """Based on the following video {material}, generate exactly {count} more multiple choice questions. Each question must have exactly 4 options, and correctAnswer is the index (0-3) of the correct option.
+
+{difficulty}
+
+{problems}Do not repeat any of these existing questions:
+{existing}
+
+{heading}:
+{text_content}
+"""
+
+# How each source is described to the model: (material, heading)
+QUIZ_MATERIALS = {
+    'transcript': ("transcript", "Transcript"),
+    'outline': ("outline, given as chapters with their start time in seconds, title, bullet points and named entities", "Outline")
+}
+
+# Everything besides the transcript (or outline) that determines a quiz, so
+# cached quizzes are never served across prompt/model changes
+QUIZ_VERSION = hashlib.sha256(
+    f"{QUIZ_MODEL}\n{QUIZ_MODE}:{QUIZ_SOURCE}:{QUIZ_TOKEN_BUDGET}\n{json.dumps(QUIZ_DIFFICULTIES, sort_keys=True)}\n"
+    f"{STRUCTURED_QUIZ_PROMPT}\n{REASK_QUIZ_PROMPT}".encode('utf-8')
+).hexdigest()[:12]
+
+def validate_item(item: QuizItem, seen: set) -> Optional[str]:
+    """Why a generated question can't be used, or None if it can."""
+    if not item.question.strip():
+        return "the question is empty"
+    if len(item.options) != 4:
+        return f"it has {len(item.options)} options instead of 4"
+    if any(not option.strip() for option in item.options):
+        return "an option is empty"
+    if len({option.strip().lower() for option in item.options}) != 4:
+        return "two options are the same"
+    if not 0 <= item.correctAnswer < 4:
+        return f"correctAnswer {item.correctAnswer} is not between 0 and 3"
+    if item.question.strip().lower() in seen:
+        return "it repeats another question"
+    return None
+
+def allocate_questions(weights: List[int], total: int) -> List[int]:
+    """Split total questions across batches in proportion to their weights (largest remainder)."""
+    shares = [total * weight / sum(weights) for weight in weights]
+    counts = [math.floor(share) for share in shares]
+    by_remainder = sorted(range(len(shares)), key=lambda i: counts[i] - shares[i])
+    for i in by_remainder[:total - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+async def generate_batch(
+    llm: ChatOpenAI,
+    text_content: str,
+    count: int,
+    seen: set,
+    source: str = 'transcript',
+    difficulty: str = QUIZ_DEFAULT_DIFFICULTY,
+    endpoint: str = "quiz"
+) -> Tuple[List[QuizItem], int]:
+    """
+    Generate count valid questions from one batch of transcript or outline text.
+
+    Invalid items are dropped and only the shortfall is asked for again, up to
+    QUIZ_MAX_REASKS times. seen holds normalized question texts across batches.
+
+    Returns:
+        (valid questions, LLM calls made)
+    """
+    chain = llm.with_structured_output(QuizBatch)
+    material, heading = QUIZ_MATERIALS[source]
+    valid: List[QuizItem] = []
+    problems: List[str] = []
+    calls = 0
+    for attempt in range(QUIZ_MAX_REASKS + 1):
+        missing = count - len(valid)
+        if missing <= 0:
+            break
+        if attempt == 0:
+            prompt = STRUCTURED_QUIZ_PROMPT.format(
+                material=material,
+                heading=heading,
+                difficulty=QUIZ_DIFFICULTIES[difficulty],
+                count=missing,
+                text_content=text_content
+            )
+        else:
+            logger.info(f"Re-asking for {missing} quiz questions ({len(problems)} invalid)")
+            prompt = REASK_QUIZ_PROMPT.format(
+                material=material,
+                heading=heading,
+                difficulty=QUIZ_DIFFICULTIES[difficulty],
+                count=missing,
+                problems="".join(f"A previous question was rejected because {problem}.\n" for problem in problems) + "\n" if problems else "",
+                existing="\n".join(f"- {item.question}" for item in valid) or "- (none)",
+                text_content=text_content
+            )
+        calls += 1
+        try:
+            batch = await llm_scheduler.run(endpoint, lambda: chain.ainvoke(prompt), count_tokens(prompt, QUIZ_MODEL))
+        except Exception as e:
+            logger.error(f"Error generating quiz batch: {str(e)}")
+            continue
+        problems = []
+        for item in batch.questions:
+            if len(valid) == count:
+                break
+            problem = validate_item(item, seen)
+            if problem:
+                problems.append(problem)
+                continue
+            seen.add(item.question.strip().lower())
+            valid.append(item)
+    return valid, calls
+
+def chapter_batches(chapters: List[FinalizedOutlinePoint]) -> List[str]:
+    """Outline text in batches of whole chapters, up to QUIZ_TOKEN_BUDGET tokens each."""
+    batches: List[List[FinalizedOutlinePoint]] = []
+    current: List[FinalizedOutlinePoint] = []
+    total = 0
+    for chapter in chapters:
+        tokens = count_tokens(chapters_text([chapter]), QUIZ_MODEL)
+        if current and total + tokens > QUIZ_TOKEN_BUDGET:
+            batches.append(current)
+            current, total = [], 0
+        current.append(chapter)
+        total += tokens
+    if current:
+        batches.append(current)
+    return [chapters_text(batch) for batch in batches]
+
+async def generate_structured_quiz(
+    llm: ChatOpenAI,
+    request: QuizGenerationRequest,
+    endpoint: str = "quiz"
+) -> List[QuizQuestion]:
+    """
+    Generate num_questions questions in one call per QUIZ_TOKEN_BUDGET of
+    outline chapters if the request has them, otherwise of transcript.
+    """
+    if request.chapters:
+        source = 'outline'
+        # Per-segment chapters carry more detail than merged ones
+        texts = chapter_batches(leaf_chapters(request.chapters))
+    else:
+        source = 'transcript'
+        texts = [segment_text(batch) for batch in split_by_tokens(request.transcript, QUIZ_TOKEN_BUDGET, model=QUIZ_MODEL)]
+    tokens = [count_tokens(text, QUIZ_MODEL) for text in texts]
+    counts = allocate_questions(tokens, request.num_questions)
+    seen: set = set()
+    results = await asyncio.gather(*[
+        generate_batch(llm, text, count, seen, source, request.difficulty, endpoint)
+        for text, count in zip(texts, counts) if count > 0
+    ])
+    items = [item for batch_items, _ in results for item in batch_items]
+    calls = sum(batch_calls for _, batch_calls in results)
+    logger.info(f"Generated {len(items)}/{request.num_questions} quiz questions from the {source} "
+                f"({sum(tokens)} tokens) in {calls} calls over {len(texts)} batches")
+    return [
+        QuizQuestion(id=i + 1, question=item.question, options=item.options, correctAnswer=item.correctAnswer)
+        for i, item in enumerate(items)
+    ]
+
+async def generate_quiz_questions(request: QuizGenerationRequest, endpoint: str = "quiz") -> List[QuizQuestion]:
     """
     Generate quiz questions based on the provided transcript.
     
     Args:
-        request (QuizGenerationRequest): The request containing the transcript
+        request (QuizGenerationRequest): The request containing the transcript, and
+            outline chapters to use instead of it in structured mode
+        endpoint (str): LLM scheduler endpoint the calls are charged to
         
     Returns:
         List[QuizQuestion]: A list of generated quiz questions
     """
     try:
-        logger.info("Starting quiz generation")
+        logger.info(f"Starting quiz generation ({QUIZ_MODE} mode)")
+        
+        if QUIZ_MODE == 'structured':
+            if not request.transcript and not request.chapters:
+                logger.warning("No transcript to generate questions from")
+                return []
+            llm = llm_clients.chat_model(QUIZ_MODEL, temperature=0.3)
+            return await generate_structured_quiz(llm, request, endpoint)
         
         # Split transcript into segments
         segments = request.split_transcript()
@@ -109,15 +335,12 @@ async def generate_quiz_questions(request: QuizGenerationRequest) -> List[QuizQu
             logger.warning("No transcript segments to generate questions from")
             return []
             
-        # Initialize ChatGPT
-        llm = ChatOpenAI(
-            model="gpt-4o-mini",
-            temperature=0.3
-        )
+        # Shared ChatGPT client
+        llm = llm_clients.chat_model(QUIZ_MODEL, temperature=0.3)
         
         # Generate questions for all segments in parallel
         segment_questions = await asyncio.gather(*[
-            generate_questions_for_segment(llm, segment, i+1)
+            generate_questions_for_segment(llm, segment, i+1, endpoint)
             for i, segment in enumerate(segments)
         ])
         
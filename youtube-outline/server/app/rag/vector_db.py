@@ -1,8 +1,10 @@
-from typing import Dict, List, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
+from bisect import bisect_right
 from pinecone import Pinecone
 from langchain_openai import OpenAIEmbeddings
 import os
 import uuid
+import asyncio
 from dotenv import load_dotenv
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_pinecone import PineconeVectorStore
@@ -10,14 +12,58 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+def chunk_times(transcript: List[Dict[str, Union[str, float]]], full_text: str, chunks: List[str]) -> List[Tuple[float, float]]:
+    """
+    Video time span of each chunk split from full_text.
+
+    Args:
+        transcript: Transcript entries joined with single spaces into full_text
+        full_text: The joined transcript text
+        chunks: Chunks of full_text in order, as returned by the text splitter
+
+    Returns:
+        (start, end) seconds for each chunk, from the first to the last entry it overlaps
+    """
+    # Character offset at which each entry begins in full_text
+    offsets = []
+    position = 0
+    for segment in transcript:
+        offsets.append(position)
+        position += len(segment['text']) + 1
+    times = []
+    search_from = 0
+    for chunk in chunks:
+        # Overlapping chunks start after the previous chunk's start
+        begin = full_text.find(chunk, search_from)
+        if begin < 0:
+            begin = search_from
+        search_from = begin + 1
+        first = transcript[max(bisect_right(offsets, begin) - 1, 0)]
+        last = transcript[max(bisect_right(offsets, begin + len(chunk) - 1) - 1, 0)]
+        times.append((float(first['start']), float(last['start']) + float(last.get('duration', 0))))
+    return times
+
 class VectorDB:
-    def __init__(self):
+    def __init__(self, embeddings: Optional[OpenAIEmbeddings] = None):
+        """
+        Args:
+            embeddings: Embeddings client to share; a new one is built if omitted
+        """
         load_dotenv()
         self.pc = Pinecone(
             api_key=os.getenv('PINECONE_API_KEY')
         )
         self.index_name = "youtube-transcripts"
-        self.embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+        # Known data-plane host skips the describe_index lookup when the index is opened
+        self.index_host = os.getenv('PINECONE_INDEX_HOST', '')
+        self.embeddings = embeddings or OpenAIEmbeddings(model="text-embedding-3-small")
+        self._index = None
+
+    def index(self):
+        """Index handle, opened once so queries reuse its connection pool."""
+        if self._index is None:
+            self._index = self.pc.Index(self.index_name, host=self.index_host)
+        return self._index
         
     async def upload_transcript(self, transcript: List[Dict[str, Union[str, float]]], video_id: str) -> None:
         """
@@ -41,11 +87,11 @@ class VectorDB:
             logger.info(f"Split into {len(chunks)} chunks")
             logger.debug(f"First chunk preview: {chunks[0][:100]}...")
             
-            # Create metadata for each chunk
+            # Create metadata for each chunk, with the video time it covers
             texts_with_metadata = [{
                 'text': chunk,
-                'metadata': {'video_id': video_id}
-            } for chunk in chunks]
+                'metadata': {'video_id': video_id, 'start': start, 'end': end}
+            } for chunk, (start, end) in zip(chunks, chunk_times(transcript, full_text, chunks))]
             logger.info(f"Created metadata for {len(texts_with_metadata)} chunks")
             
             # Check if index exists
@@ -78,20 +124,23 @@ class VectorDB:
             top_k: Number of results to return
             
         Returns:
-            List of dictionaries containing matching text chunks with scores and metadata
+            List of dictionaries containing matching text chunks with scores, metadata
+            and the chunk's start and end in seconds (None for chunks uploaded without them)
         """
         try:
             logger.info(f"Searching transcript for video_id: {video_id} with query: {query}")
             
             # Get query embedding
-            query_embedding = self.embeddings.embed_query(query)
+            query_embedding = await self.embeddings.aembed_query(query)
             
-            # Search in Pinecone with metadata filter
-            results = self.pc.Index(self.index_name).query(
-                vector=query_embedding,
-                filter={"video_id": video_id},
-                top_k=top_k,
-                include_metadata=True
+            # Search in Pinecone with metadata filter (the Pinecone client is blocking)
+            results = await asyncio.to_thread(
+                lambda: self.index().query(
+                    vector=query_embedding,
+                    filter={"video_id": video_id},
+                    top_k=top_k,
+                    include_metadata=True
+                )
             )
             
             logger.info(f"Found {len(results.matches)} matches")
@@ -101,6 +150,8 @@ class VectorDB:
                 {
                     "text": match.metadata.get("text", ""),
                     "score": match.score,
+                    "start": match.metadata.get("start"),
+                    "end": match.metadata.get("end"),
                     "metadata": {"video_id": match.metadata.get("video_id")}
                 }
                 for match in results.matches
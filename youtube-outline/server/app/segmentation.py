@@ -0,0 +1,208 @@
+from typing import Callable, List, Optional
+from bisect import bisect_left
+from functools import lru_cache
+import hashlib
+import json
+import logging
+import os
+import re
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+# "time" keeps the equal-duration slices from calculate_target_segments;
+# "tokens" packs entries up to SEGMENT_TOKEN_BUDGET counted tokens per call
+SEGMENTATION_MODE = os.getenv('SEGMENTATION_MODE', 'time')
+SEGMENT_TOKEN_BUDGET = int(os.getenv('SEGMENT_TOKEN_BUDGET', 4000))
+# Prefer cutting at the longest silence once a segment is at least
+# SEGMENT_MIN_FILL of the budget, instead of at the exact budget boundary
+SEGMENT_SNAP_TO_PAUSES = os.getenv('SEGMENT_SNAP_TO_PAUSES', 'false').lower() == 'true'
+SEGMENT_MIN_FILL = float(os.getenv('SEGMENT_MIN_FILL', 0.75))
+
+# "compact" renders a segment as normalized caption text with an integer
+# [seconds] anchor every PROMPT_ANCHOR_INTERVAL seconds; "full" puts the exact
+# float start before every entry
+PROMPT_FORMAT = os.getenv('PROMPT_FORMAT', 'compact')
+PROMPT_ANCHOR_INTERVAL = float(os.getenv('PROMPT_ANCHOR_INTERVAL', 30))
+
+# Hesitations and caption artifacts that carry no content
+_FILLER = re.compile(r"\b(?:u+h+|u+m+|e+r+m+|h+m+)\b[,.]?", re.IGNORECASE)
+_NON_SPEECH = re.compile(r"\[(?:music|\s*_+\s*)\]", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+# Roughly four characters per token for English text with the OpenAI tokenizers
+APPROX_CHARS_PER_TOKEN = 4
+
+@lru_cache(maxsize=None)
+def token_counter(model: str = "gpt-4o-mini") -> Callable[[str], int]:
+    """
+    Token counting function for model's tokenizer.
+
+    Falls back to a character-based estimate if the tiktoken encoding cannot be
+    loaded (it is downloaded on first use), so segmentation never fails on it;
+    the returned function's `estimated` attribute says which one is in use.
+    """
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding('o200k_base')
+        count = lambda text: len(encoding.encode(text))
+        count.estimated = False
+    except Exception as e:
+        logger.warning(f"Could not load tiktoken encoding for {model}, estimating tokens: {str(e)}")
+        count = lambda text: max(1, round(len(text) / APPROX_CHARS_PER_TOKEN))
+        count.estimated = True
+    return count
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    return token_counter(model)(text)
+
+def entry_line(entry: dict) -> str:
+    """How a transcript entry is rendered in the "full" prompt format."""
+    return f"[{entry['start']}s] {entry['text']}"
+
+def normalize_text(text: str) -> str:
+    """Drop filler words and non-speech tags and collapse whitespace."""
+    text = _NON_SPEECH.sub(" ", text)
+    text = _FILLER.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+def anchor(start: float) -> str:
+    return f"[{int(start)}]"
+
+def segment_text(segment: List[dict], prompt_format: Optional[str] = None) -> str:
+    """
+    Render transcript entries for a prompt.
+
+    In the compact format, anchors are the integer part of an entry's start,
+    so resolve_timestamp maps a timestamp the model copies back to that entry.
+    """
+    if (prompt_format or PROMPT_FORMAT) == 'full':
+        return " ".join(entry_line(entry) for entry in segment)
+    parts = []
+    last_anchor = None
+    for entry in segment:
+        if last_anchor is None or entry['start'] - last_anchor >= PROMPT_ANCHOR_INTERVAL:
+            parts.append(anchor(entry['start']))
+            last_anchor = entry['start']
+        text = normalize_text(entry['text'])
+        if text:
+            parts.append(text)
+    return " ".join(parts)
+
+def resolve_timestamp(seconds: float, segment: List[dict]) -> float:
+    """Exact start time of the entry in segment closest to a timestamp returned by the model."""
+    starts = [entry['start'] for entry in segment]
+    # Anchors truncate starts, so an anchor value is the first entry at or after it
+    i = bisect_left(starts, int(seconds))
+    if i < len(starts) and int(starts[i]) == int(seconds):
+        return starts[i]
+    return min(starts[max(0, i - 1):i + 1], key=lambda start: abs(start - seconds))
+
+def transcript_hash(transcript_entries: List[dict]) -> str:
+    """
+    Content hash of a transcript: the same entries hash the same no matter
+    which video ID or request they came from.
+    """
+    canonical = json.dumps(
+        [[entry['start'], entry.get('duration', 0), entry['text']] for entry in transcript_entries],
+        separators=(',', ':'),
+        ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def split_by_duration(transcript_entries: List[dict], segment_duration: float) -> List[List[dict]]:
+    """
+    Split entries on a grid of segment_duration seconds from the first entry's start.
+
+    Unlike the equal-time splitter the boundaries do not depend on where the
+    transcript ends, so entries appended later never move earlier cuts.
+    """
+    segments = []
+    current: List[dict] = []
+    boundary = transcript_entries[0]['start'] + segment_duration if transcript_entries else 0
+    for entry in transcript_entries:
+        if current and entry['start'] >= boundary:
+            segments.append(current)
+            current = []
+            while entry['start'] >= boundary:
+                boundary += segment_duration
+        current.append(entry)
+    if current:
+        segments.append(current)
+    return segments
+
+def _gap_before(entries: List[dict], i: int) -> float:
+    previous = entries[i - 1]
+    return entries[i]['start'] - (previous['start'] + previous.get('duration', 0))
+
+def split_by_tokens(
+    transcript_entries: List[dict],
+    token_budget: Optional[int] = None,
+    snap_to_pauses: Optional[bool] = None,
+    model: str = "gpt-4o-mini"
+) -> List[List[dict]]:
+    """
+    Pack consecutive transcript entries into segments of at most token_budget tokens.
+
+    Args:
+        transcript_entries: List of transcript entries (each with 'start', 'duration' and 'text')
+        token_budget: Tokens of rendered transcript per segment (SEGMENT_TOKEN_BUDGET);
+            the prompt template is not included. Entries are counted as rendered
+            by segment_text, so totals are within a few anchor tokens of the result
+        snap_to_pauses: Cut at the longest pause between entries once the segment
+            holds SEGMENT_MIN_FILL of the budget (SEGMENT_SNAP_TO_PAUSES)
+        model: Model whose tokenizer is used for counting
+
+    Returns:
+        List of transcript segments. An entry longer than the budget gets a segment of its own.
+    """
+    token_budget = token_budget or SEGMENT_TOKEN_BUDGET
+    snap_to_pauses = SEGMENT_SNAP_TO_PAUSES if snap_to_pauses is None else snap_to_pauses
+    count = token_counter(model)
+    min_fill = token_budget * SEGMENT_MIN_FILL
+
+    compact = PROMPT_FORMAT != 'full'
+    anchor_tokens = count(anchor(transcript_entries[-1]['start'])) + 1 if transcript_entries else 0
+    last_anchor = None
+
+    segments = []
+    current: List[dict] = []
+    current_tokens: List[int] = []  # tokens per entry in current, +1 for the joining space
+    total = 0
+    for entry in transcript_entries:
+        if not compact:
+            tokens = count(entry_line(entry)) + 1
+        else:
+            text = normalize_text(entry['text'])
+            tokens = count(text) + 1 if text else 0
+            if last_anchor is None or entry['start'] - last_anchor >= PROMPT_ANCHOR_INTERVAL:
+                tokens += anchor_tokens
+                last_anchor = entry['start']
+        if current and total + tokens > token_budget:
+            cut = len(current)
+            if snap_to_pauses:
+                # Candidate cut points: entries whose preceding prefix is already full enough
+                filled = 0
+                best_gap = None
+                for i in range(1, len(current)):
+                    filled += current_tokens[i - 1]
+                    if filled >= min_fill and (best_gap is None or _gap_before(current, i) > best_gap):
+                        best_gap = _gap_before(current, i)
+                        cut = i
+                if best_gap is not None and _gap_before([current[-1], entry], 1) >= best_gap:
+                    cut = len(current)
+            segments.append(current[:cut])
+            current, current_tokens = current[cut:], current_tokens[cut:]
+            total = sum(current_tokens)
+            if current and total + tokens > token_budget:
+                segments.append(current)
+                current, current_tokens, total = [], [], 0
+        current.append(entry)
+        current_tokens.append(tokens)
+        total += tokens
+
+    if current:
+        segments.append(current)
+    return segments
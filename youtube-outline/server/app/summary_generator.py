@@ -1,11 +1,21 @@
 from pydantic import BaseModel
-from typing import List
+from typing import Any, AsyncIterator, List, NamedTuple, Optional, Tuple, Union
 from langchain_openai import ChatOpenAI
 import logging
 from pprint import pformat
 from fastapi import HTTPException
 import asyncio
+import hashlib
 import math
+import os
+import random
+
+from .segmentation import (
+    SEGMENTATION_MODE, SEGMENT_TOKEN_BUDGET, SEGMENT_SNAP_TO_PAUSES, PROMPT_FORMAT, PROMPT_ANCHOR_INTERVAL,
+    count_tokens, segment_text, split_by_duration, split_by_tokens, transcript_hash
+)
+from .llm_clients import llm_clients
+from .llm_scheduler import llm_scheduler
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -62,6 +72,47 @@ Transcript segment:
 {text_content}
 """
 
+# Merges adjacent chapters in the reduce pass of the hierarchical outline mode
+MERGE_CHAPTERS_PROMPT = """Below are consecutive chapters from an outline of a YouTube video, in order. Each one has its start time in seconds, its title and bullet points summarizing it. Merge them into a single chapter that covers all of them:
+
+- Create a concise and descriptive title for the combined section as a whole, not just its first chapter
+- Provide 3-5 bullet points summarizing the key points across the whole section
+- Keep the most important named entities from the chapters, with their types
+
+Chapters:
+{chapters}
+"""
+
+OUTLINE_MODEL = "gpt-4o-mini"
+
+# "flat" returns one chapter per segment. "hierarchical" runs the chapter
+# prompt over fine segments of OUTLINE_MAP_SEGMENT_MINUTES (map) and then
+# merges runs of OUTLINE_REDUCE_FANOUT adjacent chapters (reduce) until at
+# most OUTLINE_MAX_CHAPTERS remain; merged chapters keep theirs as children
+OUTLINE_MODE = os.getenv('OUTLINE_MODE', 'flat')
+OUTLINE_MAP_SEGMENT_MINUTES = float(os.getenv('OUTLINE_MAP_SEGMENT_MINUTES', 5))
+OUTLINE_REDUCE_FANOUT = int(os.getenv('OUTLINE_REDUCE_FANOUT', 4))
+OUTLINE_MAX_CHAPTERS = int(os.getenv('OUTLINE_MAX_CHAPTERS', 12))
+
+# Bump when segmentation or post-processing changes outline output; prompt,
+# model and segmentation settings are picked up automatically through the hash below
+OUTLINE_PIPELINE_VERSION = 1
+
+# Identifies everything besides the transcript that determines an outline, so
+# cached outlines are never served across prompt/model changes
+OUTLINE_VERSION = hashlib.sha256(
+    f"{OUTLINE_PIPELINE_VERSION}\n{OUTLINE_MODEL}\n"
+    f"{SEGMENTATION_MODE}:{SEGMENT_TOKEN_BUDGET}:{SEGMENT_SNAP_TO_PAUSES}\n"
+    f"{PROMPT_FORMAT}:{PROMPT_ANCHOR_INTERVAL}\n"
+    f"{OUTLINE_MODE}:{OUTLINE_MAP_SEGMENT_MINUTES}:{OUTLINE_REDUCE_FANOUT}:{OUTLINE_MAX_CHAPTERS}\n"
+    f"{CHAPTER_SUMMARY_PROMPT}\n{MERGE_CHAPTERS_PROMPT}".encode('utf-8')
+).hexdigest()[:12]
+
+# What a single chapter call's output depends on besides its segment text;
+# per-segment results are memoized under this
+CHAPTER_PROMPT_VERSION = hashlib.sha256(f"{OUTLINE_MODEL}\n{CHAPTER_SUMMARY_PROMPT}".encode('utf-8')).hexdigest()[:12]
+MERGE_PROMPT_VERSION = hashlib.sha256(f"{OUTLINE_MODEL}\n{MERGE_CHAPTERS_PROMPT}".encode('utf-8')).hexdigest()[:12]
+
 class OutlinePoint(BaseModel):
     text: str
     start: float
@@ -69,15 +120,55 @@ class OutlinePoint(BaseModel):
 class OutlineResponse(BaseModel):
     points: List[OutlinePoint]
 
+class ChapterSummary(BaseModel):
+    text: str
+    bullet_points: List[str]
+    entities: List[NamedEntity] = []
+
 class FinalizedOutlinePoint(BaseModel):
     text: str
     start: float
     duration: float
     bullet_points: List[str]
     entities: List[NamedEntity] = []
+    # Chapters merged into this one (hierarchical mode only)
+    children: List['FinalizedOutlinePoint'] = []
+
+class FailedSegment(BaseModel):
+    segment: int
+    start: float
+    duration: float
+    error: str
+
+class OutlineSource(BaseModel):
+    """Which transcript entries each chapter came from, so an appended transcript can reuse them."""
+    entries: int
+    transcript_hash: str
+    # Entry index each segment ends at (exclusive), in order
+    segment_ends: List[int]
+    # transcript_hash of the entries before the last segment; a transcript
+    # that starts with the same entries extends this outline
+    prefix_hash: str
 
 class FinalizedOutlineResponse(BaseModel):
     points: List[FinalizedOutlinePoint]
+    # Segments that still failed after retries; asking again regenerates only these
+    failed_segments: List[FailedSegment] = []
+    # Chapter groups left unmerged because their merge call failed
+    failed_merges: int = 0
+    source: Optional[OutlineSource] = None
+
+class SegmentPlan(NamedTuple):
+    """Segments to outline, and the chapters already known for the first len(kept) of them."""
+    entries: List[dict]
+    segments: List[List[dict]]
+    kept: List[FinalizedOutlinePoint]
+
+# Per-segment LLM retries: attempts, per-attempt deadline (once admitted by the
+# scheduler) and base backoff between attempts
+SEGMENT_MAX_ATTEMPTS = int(os.getenv('SEGMENT_MAX_ATTEMPTS', 3))
+SEGMENT_CALL_TIMEOUT = float(os.getenv('SEGMENT_CALL_TIMEOUT', 60))
+SEGMENT_RETRY_BACKOFF = float(os.getenv('SEGMENT_RETRY_BACKOFF', 1.0))
 
 def calculate_target_segments(total_duration: float) -> int:
     """
@@ -130,22 +221,58 @@ def split_transcript(transcript_entries: List[dict], target_segments: int = 5) -
     
     return segments
 
-async def process_segment(segment: List[dict], i: int, segments: List[List[dict]], llm: ChatOpenAI) -> FinalizedOutlinePoint:
-    # Convert segment to text
-    segment_text = " ".join([f"[{entry['start']}s] {entry['text']}" for entry in segment])
-    
-    # Get summary and bullet points for this segment
-    logger.info(f"Generating summary for segment {i+1}")
-    chain = llm.with_structured_output(FinalizedOutlinePoint)
-    result = await chain.ainvoke(CHAPTER_SUMMARY_PROMPT.format(text_content=segment_text))
-    
-    # Calculate duration
+def segment_bounds(segments: List[List[dict]], i: int) -> Tuple[float, float]:
+    """Start time and duration of segment i (up to the start of the next one)."""
+    segment = segments[i]
     start_time = segment[0]['start']
     if i < len(segments) - 1:
         duration = segments[i+1][0]['start'] - start_time
     else:
         last_entry = segment[-1]
         duration = last_entry['start'] + last_entry.get('duration', 0) - start_time
+    return start_time, duration
+
+async def invoke_with_retries(chain: Any, prompt: str, prompt_tokens: int, label: str) -> Any:
+    """Run a structured-output chain through the scheduler, retrying with jittered backoff."""
+    for attempt in range(1, SEGMENT_MAX_ATTEMPTS + 1):
+        try:
+            # Calls are all started at once; the shared scheduler paces the actual
+            # calls and hedges stragglers, since the slowest one bounds outline latency
+            return await llm_scheduler.run_hedged("summary", lambda: chain.ainvoke(prompt), prompt_tokens, timeout=SEGMENT_CALL_TIMEOUT)
+        except Exception as e:
+            if attempt == SEGMENT_MAX_ATTEMPTS:
+                raise
+            delay = SEGMENT_RETRY_BACKOFF * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+            logger.warning(f"{label} attempt {attempt} failed ({type(e).__name__}: {str(e)}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+async def process_segment(
+    segment: List[dict],
+    i: int,
+    segments: List[List[dict]],
+    llm: ChatOpenAI,
+    segment_cache: Optional[Any] = None
+) -> FinalizedOutlinePoint:
+    # Convert segment to text
+    text_content = segment_text(segment)
+    
+    # Unchanged segments reuse their earlier chapter instead of calling the LLM
+    cached = await segment_cache.get(text_content) if segment_cache else None
+    if cached is not None:
+        logger.info(f"Reusing cached summary for segment {i+1}")
+        result = ChapterSummary(**cached)
+    else:
+        prompt = CHAPTER_SUMMARY_PROMPT.format(text_content=text_content)
+        
+        # Get summary and bullet points for this segment
+        prompt_tokens = count_tokens(prompt, OUTLINE_MODEL)
+        logger.info(f"Generating summary for segment {i+1} ({prompt_tokens} prompt tokens)")
+        chain = llm.with_structured_output(ChapterSummary)
+        result = await invoke_with_retries(chain, prompt, prompt_tokens, f"Segment {i+1}")
+        if segment_cache:
+            await segment_cache.put(text_content, result.dict())
+    
+    start_time, duration = segment_bounds(segments, i)
     
     return FinalizedOutlinePoint(
         text=result.text,
@@ -155,38 +282,230 @@ async def process_segment(segment: List[dict], i: int, segments: List[List[dict]
         entities=result.entities
     )
 
-async def generate_summary(transcript: dict):
+async def outline_segment(
+    segment: List[dict],
+    i: int,
+    segments: List[List[dict]],
+    llm: ChatOpenAI,
+    segment_cache: Optional[Any] = None
+) -> Union[FinalizedOutlinePoint, FailedSegment]:
+    """process_segment, with a segment that fails after all retries reported instead of raised."""
+    try:
+        return await process_segment(segment, i, segments, llm, segment_cache)
+    except Exception as e:
+        logger.error(f"Segment {i+1} failed after {SEGMENT_MAX_ATTEMPTS} attempts: {type(e).__name__}: {str(e)}")
+        start_time, duration = segment_bounds(segments, i)
+        return FailedSegment(segment=i, start=start_time, duration=duration, error=f"{type(e).__name__}: {str(e)}")
+
+def segment_transcript(transcript_entries: List[dict]) -> List[List[dict]]:
+    """Split a transcript into the segments that become outline chapters."""
+    # Calculate total duration and target segments
+    if transcript_entries:
+        last_entry = transcript_entries[-1]
+        total_duration = last_entry['start'] + last_entry.get('duration', 0)
+        target_segments = calculate_target_segments(total_duration)
+        logger.info(f"Video duration: {total_duration:.2f}s, Target segments: {target_segments}")
+    else:
+        target_segments = 5
+    
+    # Split transcript into segments
+    if SEGMENTATION_MODE == 'tokens':
+        segments = split_by_tokens(transcript_entries, model=OUTLINE_MODEL)
+    elif OUTLINE_MODE == 'hierarchical' and transcript_entries:
+        # Fine map segments of fixed length, uncapped; the reduce pass bounds the outline
+        segments = split_transcript(transcript_entries, max(1, math.ceil(total_duration / (OUTLINE_MAP_SEGMENT_MINUTES * 60))))
+    else:
+        segments = split_transcript(transcript_entries, target_segments)
+    logger.info(f"Split transcript into {len(segments)} segments ({SEGMENTATION_MODE} mode)")
+    return segments
+
+def leaf_chapters(points: List[FinalizedOutlinePoint]) -> List[FinalizedOutlinePoint]:
+    """Per-segment chapters of an outline, in order, whether or not it was reduced."""
+    leaves = []
+    for point in points:
+        leaves.extend(leaf_chapters(point.children) if point.children else [point])
+    return leaves
+
+def plan_segments(
+    transcript_entries: List[dict],
+    previous: Optional[FinalizedOutlineResponse] = None
+) -> SegmentPlan:
+    """
+    Segment a transcript, reusing the outline of a transcript it extends.
+
+    When transcript_entries start with every entry before the last segment of
+    previous, those segments and their chapters are kept as they are and
+    only the last (boundary) segment and the appended tail are re-segmented,
+    on the same duration grid (or token budget) as before.
+    """
+    source = previous.source if previous is not None else None
+    if source is not None and len(source.segment_ends) > 1 and len(transcript_entries) >= source.entries:
+        boundary = source.segment_ends[-2]
+        leaves = leaf_chapters(previous.points)
+        if len(leaves) == len(source.segment_ends) and transcript_hash(transcript_entries[:boundary]) == source.prefix_hash:
+            starts = [0] + source.segment_ends[:-2]
+            kept_segments = [transcript_entries[begin:end] for begin, end in zip(starts, source.segment_ends[:-1])]
+            tail = transcript_entries[boundary:]
+            if SEGMENTATION_MODE == 'tokens':
+                tail_segments = split_by_tokens(tail, model=OUTLINE_MODEL)
+            else:
+                # Guard against a zero grid when every kept entry shares one start time
+                segment_duration = max(1.0, (tail[0]['start'] - transcript_entries[0]['start']) / len(kept_segments))
+                tail_segments = split_by_duration(tail, segment_duration)
+            logger.info(f"Transcript extends a cached outline: keeping {len(kept_segments)} chapters, "
+                        f"outlining {len(tail_segments)} new segments")
+            return SegmentPlan(transcript_entries, kept_segments + tail_segments, leaves[:len(kept_segments)])
+    return SegmentPlan(transcript_entries, segment_transcript(transcript_entries), [])
+
+def outline_source(plan: SegmentPlan) -> Optional[OutlineSource]:
+    if not plan.segments:
+        return None
+    segment_ends = []
+    end = 0
+    for segment in plan.segments:
+        end += len(segment)
+        segment_ends.append(end)
+    boundary = segment_ends[-2] if len(segment_ends) > 1 else 0
+    return OutlineSource(
+        entries=len(plan.entries),
+        transcript_hash=transcript_hash(plan.entries),
+        segment_ends=segment_ends,
+        prefix_hash=transcript_hash(plan.entries[:boundary])
+    )
+
+def chapters_text(chapters: List[FinalizedOutlinePoint]) -> str:
+    """Render chapters for the merge prompt; also the merge cache key."""
+    blocks = []
+    for chapter in chapters:
+        lines = [f"[{int(chapter.start)}] {chapter.text}"]
+        lines += [f"- {bullet}" for bullet in chapter.bullet_points]
+        if chapter.entities:
+            lines.append("Entities: " + ", ".join(f"{entity.name} ({entity.type})" for entity in chapter.entities))
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+async def merge_chapters(
+    chapters: List[FinalizedOutlinePoint],
+    llm: ChatOpenAI,
+    merge_cache: Optional[Any] = None
+) -> FinalizedOutlinePoint:
+    """Merge adjacent chapters into one parent chapter that keeps them as children."""
+    text_content = chapters_text(chapters)
+    # A sub-tree whose chapters are unchanged reuses its earlier merge
+    cached = await merge_cache.get(text_content) if merge_cache else None
+    if cached is not None:
+        result = ChapterSummary(**cached)
+    else:
+        prompt = MERGE_CHAPTERS_PROMPT.format(chapters=text_content)
+        chain = llm.with_structured_output(ChapterSummary)
+        result = await invoke_with_retries(chain, prompt, count_tokens(prompt, OUTLINE_MODEL), f"Merge at {chapters[0].start:.0f}s")
+        if merge_cache:
+            await merge_cache.put(text_content, result.dict())
+
+    last = chapters[-1]
+    return FinalizedOutlinePoint(
+        text=result.text,
+        start=chapters[0].start,
+        duration=last.start + last.duration - chapters[0].start,
+        bullet_points=result.bullet_points,
+        entities=result.entities,
+        children=chapters
+    )
+
+async def reduce_chapters(
+    chapters: List[FinalizedOutlinePoint],
+    merge_cache: Optional[Any] = None
+) -> Tuple[List[FinalizedOutlinePoint], int]:
+    """
+    Merge runs of OUTLINE_REDUCE_FANOUT adjacent chapters, level by level,
+    until at most OUTLINE_MAX_CHAPTERS remain.
+
+    Groups are fixed runs of chapter positions, so a changed chapter only
+    changes the merges on its path to the top.
+
+    Returns:
+        (top-level chapters, number of groups left unmerged after failed merges)
+    """
+    llm = llm_clients.chat_model(OUTLINE_MODEL)
+    failed_merges = 0
+    level = chapters
+    while len(level) > OUTLINE_MAX_CHAPTERS:
+        groups = [level[i:i + OUTLINE_REDUCE_FANOUT] for i in range(0, len(level), OUTLINE_REDUCE_FANOUT)]
+        # A lone trailing chapter moves up a level as-is
+        results = await asyncio.gather(*[
+            merge_chapters(group, llm, merge_cache) if len(group) > 1 else asyncio.sleep(0, group[0])
+            for group in groups
+        ], return_exceptions=True)
+        next_level = []
+        for group, result in zip(groups, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Merging chapters at {group[0].start:.0f}s failed: {type(result).__name__}: {str(result)}")
+                failed_merges += 1
+                next_level.extend(group)
+            else:
+                next_level.append(result)
+        if len(next_level) == len(level):
+            break
+        level = next_level
+    logger.info(f"Reduced {len(chapters)} chapters to {len(level)}")
+    return level, failed_merges
+
+async def build_outline(
+    plan: SegmentPlan,
+    points: List[FinalizedOutlinePoint],
+    failed_segments: List[FailedSegment],
+    merge_cache: Optional[Any] = None
+) -> FinalizedOutlineResponse:
+    """Assemble ordered segment chapters into the response, reducing them in hierarchical mode."""
+    failed_merges = 0
+    if OUTLINE_MODE == 'hierarchical':
+        points, failed_merges = await reduce_chapters(points, merge_cache)
+    return FinalizedOutlineResponse(
+        points=points,
+        failed_segments=failed_segments,
+        failed_merges=failed_merges,
+        source=outline_source(plan)
+    )
+
+async def generate_summary(
+    transcript: dict,
+    segment_cache: Optional[Any] = None,
+    merge_cache: Optional[Any] = None,
+    previous: Optional[FinalizedOutlineResponse] = None
+):
+    """
+    Args:
+        transcript: {"transcript": [...]} request body
+        segment_cache: Optional per-segment memo (outline_cache.SegmentCache)
+        merge_cache: Optional memo of merged chapters (hierarchical mode)
+        previous: Outline of an earlier version of this video's transcript;
+            if the transcript extends it, only the new tail is outlined
+    """
     try:
         logger.info("Received request to generate summary")
         transcript_entries = transcript.get('transcript', [])
         logger.info(f"Transcript received with {len(transcript_entries)} entries")
         
-        # Calculate total duration and target segments
-        if transcript_entries:
-            last_entry = transcript_entries[-1]
-            total_duration = last_entry['start'] + last_entry.get('duration', 0)
-            target_segments = calculate_target_segments(total_duration)
-            logger.info(f"Video duration: {total_duration:.2f}s, Target segments: {target_segments}")
-        else:
-            target_segments = 5
-        
-        # Split transcript into segments
-        segments = split_transcript(transcript_entries, target_segments)
-        logger.info(f"Split transcript into {len(segments)} segments")
+        plan = plan_segments(transcript_entries, previous)
+        segments = plan.segments
         
-        llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+        llm = llm_clients.chat_model(OUTLINE_MODEL)
         
-        # Process all segments in parallel
-        async with asyncio.TaskGroup() as tg:
-            tasks = [
-                tg.create_task(process_segment(segment, i, segments, llm))
-                for i, segment in enumerate(segments)
-            ]
+        # Process all new segments in parallel; a failed segment does not cancel the others
+        results = list(plan.kept) + await asyncio.gather(*[
+            outline_segment(segments[i], i, segments, llm, segment_cache)
+            for i in range(len(plan.kept), len(segments))
+        ])
         
         # Get results in order
-        finalized_points = [task.result() for task in tasks]
+        finalized_points = [result for result in results if isinstance(result, FinalizedOutlinePoint)]
+        failed_segments = [result for result in results if isinstance(result, FailedSegment)]
+        if segments and not finalized_points:
+            raise RuntimeError(f"All {len(segments)} segments failed: {failed_segments[0].error}")
+        if failed_segments:
+            logger.warning(f"Returning partial outline: {len(failed_segments)}/{len(segments)} segments failed")
         
-        final_response = FinalizedOutlineResponse(points=finalized_points)
+        final_response = await build_outline(plan, finalized_points, failed_segments, merge_cache)
         logger.info(f"Finalized response with summaries:\n{pformat(final_response.dict(), indent=2)}")
         return final_response
         
@@ -194,3 +513,38 @@ async def generate_summary(transcript: dict):
         logger.error(f"Error generating summary: {str(e)}")
         logger.exception("Full traceback:")
         raise HTTPException(status_code=500, detail=str(e))
+
+async def stream_summary(
+    plan: SegmentPlan,
+    segment_cache: Optional[Any] = None
+) -> AsyncIterator[Tuple[int, int, Union[FinalizedOutlinePoint, FailedSegment]]]:
+    """
+    Generate outline chapters, yielding each one as soon as its segment completes.
+
+    Args:
+        plan: Segments from plan_segments; kept chapters are yielded first
+        segment_cache: Optional per-segment memo (outline_cache.SegmentCache)
+
+    Yields:
+        (segment index, segment count, chapter or FailedSegment), in completion order
+    """
+    segments = plan.segments
+    logger.info(f"Streaming summary for transcript with {len(plan.entries)} entries")
+    for i, point in enumerate(plan.kept):
+        yield i, len(segments), point
+    llm = llm_clients.chat_model(OUTLINE_MODEL)
+
+    tasks = {
+        asyncio.create_task(outline_segment(segments[i], i, segments, llm, segment_cache)): i
+        for i in range(len(plan.kept), len(segments))
+    }
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=tasks.get):
+                yield tasks[task], len(segments), task.result()
+    finally:
+        # Client went away: stop paying for the rest
+        for task in pending:
+            task.cancel()
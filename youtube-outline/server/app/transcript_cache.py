@@ -0,0 +1,396 @@
+from typing import Any, Dict, NamedTuple, Optional
+from collections import OrderedDict
+from contextlib import AsyncExitStack
+from aiobotocore.session import get_session
+from aiobotocore.config import AioConfig
+from botocore.exceptions import ClientError
+import asyncio
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPT_CACHE_BUCKET = 'youtube-transcripts-cache'
+
+class TranscriptLRU:
+    """
+    In-process LRU tier in front of the S3 cache.
+
+    Bounded by the total serialized size of its entries rather than by entry
+    count, so a handful of multi-hour podcasts cannot push out everything else.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, ttl: Optional[float] = None):
+        """
+        Args:
+            max_bytes: Byte budget for all entries (TRANSCRIPT_LRU_MAX_BYTES, default 64MB)
+            ttl: Seconds an entry stays valid (TRANSCRIPT_LRU_TTL, default 3600)
+        """
+        self.max_bytes = max_bytes or int(os.getenv('TRANSCRIPT_LRU_MAX_BYTES', 64 * 1024 * 1024))
+        self.ttl = ttl or float(os.getenv('TRANSCRIPT_LRU_TTL', 3600))
+        self._entries: OrderedDict = OrderedDict()  # key -> (value, size, expires_at)
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, size, expires_at = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any, size: int, ttl: Optional[float] = None) -> None:
+        """
+        Insert or replace an entry, evicting least recently used entries to fit.
+
+        Args:
+            key: Cache key
+            value: Cached value
+            size: Size in bytes charged against the budget (see transcript_format.estimate_size)
+            ttl: Overrides the cache-wide TTL for this entry
+        """
+        if key in self._entries:
+            self._remove(key)
+        if size > self.max_bytes:
+            return
+        while self.current_bytes + size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+        self._entries[key] = (value, size, time.monotonic() + (ttl if ttl is not None else self.ttl))
+        self.current_bytes += size
+
+    def invalidate(self, key: str) -> None:
+        if key in self._entries:
+            self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self.current_bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+class CachedObject(NamedTuple):
+    body: Optional[bytes]
+    metadata: Dict[str, str]
+    etag: Optional[str]
+    not_modified: bool = False
+
+class S3TranscriptCache:
+    """
+    Asynchronous S3 client for the transcript cache bucket.
+
+    Uses a single long-lived aiobotocore client so every request shares one
+    bounded connection pool instead of blocking the event loop on boto3 calls.
+    """
+
+    def __init__(
+        self,
+        bucket: str = TRANSCRIPT_CACHE_BUCKET,
+        max_connections: Optional[int] = None,
+        timeout: Optional[float] = None
+    ):
+        """
+        Args:
+            bucket: S3 bucket holding cached transcripts
+            max_connections: Size of the connection pool (S3_MAX_CONNECTIONS, default 20)
+            timeout: Per-call deadline in seconds (S3_TIMEOUT, default 2.0)
+        """
+        self.bucket = bucket
+        self.max_connections = max_connections or int(os.getenv('S3_MAX_CONNECTIONS', 20))
+        self.timeout = timeout or float(os.getenv('S3_TIMEOUT', 2.0))
+        self._client = None
+        self._exit_stack = AsyncExitStack()
+        self._start_lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        """Create the pooled client. Safe to call more than once."""
+        async with self._start_lock:
+            if self._client is not None:
+                return
+            config = AioConfig(
+                max_pool_connections=self.max_connections,
+                connect_timeout=self.timeout,
+                read_timeout=self.timeout,
+                retries={'max_attempts': 2, 'mode': 'standard'},
+                s3={'addressing_style': 'path'} if os.getenv('S3_ENDPOINT_URL') else None
+            )
+            self._client = await self._exit_stack.enter_async_context(
+                get_session().create_client(
+                    's3',
+                    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+                    region_name=os.getenv('AWS_REGION'),
+                    endpoint_url=os.getenv('S3_ENDPOINT_URL'),
+                    config=config
+                )
+            )
+            logger.info(f"Started S3 transcript cache client (bucket={self.bucket}, pool={self.max_connections})")
+
+    async def close(self) -> None:
+        """Close the client and release pooled connections."""
+        await self._exit_stack.aclose()
+        self._exit_stack = AsyncExitStack()
+        self._client = None
+
+    async def _get_client(self):
+        if self._client is None:
+            await self.start()
+        return self._client
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """
+        Read an object from the cache bucket.
+
+        Args:
+            key: Object key
+
+        Returns:
+            The object body, or None if the key does not exist
+
+        Raises:
+            TimeoutError: If the call exceeds the per-call deadline
+        """
+        result = await self.get_object(key)
+        return result.body if result else None
+
+    async def get_object(self, key: str, if_none_match: Optional[str] = None) -> Optional['CachedObject']:
+        """
+        Read an object with its ETag and user metadata, optionally conditionally.
+
+        Args:
+            key: Object key
+            if_none_match: ETag the caller already has; S3 skips the body if it still matches
+
+        Returns:
+            CachedObject (with not_modified set and no body if the ETag matched),
+            or None if the key does not exist
+
+        Raises:
+            TimeoutError: If the call exceeds the per-call deadline
+        """
+        client = await self._get_client()
+        params = {'Bucket': self.bucket, 'Key': key}
+        if if_none_match:
+            params['IfNoneMatch'] = if_none_match
+        try:
+            async with asyncio.timeout(self.timeout):
+                response = await client.get_object(**params)
+                async with response['Body'] as stream:
+                    body = await stream.read()
+                return CachedObject(body, response.get('Metadata', {}), response.get('ETag'))
+        except client.exceptions.NoSuchKey:
+            return None
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('304', 'NotModified'):
+                return CachedObject(None, {}, if_none_match, not_modified=True)
+            raise
+
+    async def put(
+        self,
+        key: str,
+        body: bytes,
+        content_type: str = 'application/json',
+        content_encoding: Optional[str] = None,
+        metadata: Optional[Dict[str, str]] = None
+    ) -> None:
+        """
+        Write an object to the cache bucket.
+
+        Args:
+            key: Object key
+            body: Object body
+            content_type: Content-Type stored with the object
+            content_encoding: Content-Encoding stored with the object (e.g. gzip)
+            metadata: User metadata stored with the object
+
+        Raises:
+            TimeoutError: If the call exceeds the per-call deadline
+        """
+        client = await self._get_client()
+        extra = {}
+        if content_encoding:
+            extra['ContentEncoding'] = content_encoding
+        if metadata:
+            extra['Metadata'] = metadata
+        async with asyncio.timeout(self.timeout):
+            await client.put_object(Bucket=self.bucket, Key=key, Body=body, ContentType=content_type, **extra)
+
+    async def delete(self, key: str) -> None:
+        """
+        Delete an object from the cache bucket. Missing keys are not an error.
+
+        Raises:
+            TimeoutError: If the call exceeds the per-call deadline
+        """
+        client = await self._get_client()
+        async with asyncio.timeout(self.timeout):
+            await client.delete_object(Bucket=self.bucket, Key=key)
+
+class TranscriptUnavailable(Exception):
+    """Raised when a negative cache entry says the video has no usable transcript."""
+
+    def __init__(self, video_id: str, reason: str):
+        super().__init__(f"Transcript not available for {video_id} ({reason}, cached)")
+        self.video_id = video_id
+        self.reason = reason
+
+# How long we trust that a video has no transcript, per YouTubeTranscriptApi error
+NEGATIVE_CACHE_TTLS = {
+    'TranscriptsDisabled': float(os.getenv('NEGATIVE_TTL_TRANSCRIPTS_DISABLED', 24 * 3600)),
+    'NoTranscriptFound': float(os.getenv('NEGATIVE_TTL_NO_TRANSCRIPT_FOUND', 6 * 3600))
+}
+DEFAULT_NEGATIVE_TTL = 3600
+
+class NegativeTranscriptCache:
+    """
+    Remembers videos whose transcripts are unavailable so retries skip the proxy.
+
+    Entries live under unavailable/{video_id}.json in the cache bucket, with an
+    in-process copy in front, and expire after the TTL for their reason.
+    """
+
+    def __init__(self, store: S3TranscriptCache):
+        self.store = store
+        self._memory = TranscriptLRU(max_bytes=1024 * 1024)
+        self.hits: Dict[str, int] = {}
+        self.stores: Dict[str, int] = {}
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(video_id: str) -> str:
+        return f"unavailable/{video_id}.json"
+
+    async def get(self, video_id: str) -> Optional[str]:
+        """
+        Returns:
+            The cached reason if the video is known to be unavailable, else None
+        """
+        reason = self._memory.get(video_id)
+        if reason is None:
+            body = await self.store.get(self._key(video_id))
+            if body is None:
+                return None
+            data = json.loads(body)
+            remaining = data['expires_at'] - time.time()
+            if remaining <= 0:
+                return None
+            reason = data['reason']
+            self._memory.put(video_id, reason, len(video_id) + len(reason), ttl=remaining)
+        self.hits[reason] = self.hits.get(reason, 0) + 1
+        return reason
+
+    async def put(self, video_id: str, reason: str) -> None:
+        ttl = NEGATIVE_CACHE_TTLS.get(reason, DEFAULT_NEGATIVE_TTL)
+        self._memory.put(video_id, reason, len(video_id) + len(reason), ttl=ttl)
+        self.stores[reason] = self.stores.get(reason, 0) + 1
+        now = time.time()
+        await self.store.put(self._key(video_id), json.dumps({
+            'reason': reason,
+            'cached_at': int(now),
+            'expires_at': int(now + ttl)
+        }).encode('utf-8'))
+
+    async def invalidate(self, video_id: str) -> None:
+        self._memory.invalidate(video_id)
+        self.invalidations += 1
+        await self.store.delete(self._key(video_id))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits_by_reason": dict(self.hits),
+            "stores_by_reason": dict(self.stores),
+            "invalidations": self.invalidations,
+            "memory_entries": self._memory.stats()["entries"]
+        }
+
+class RevalidationPolicy:
+    """
+    Freshness rules and a global budget for background transcript refreshes.
+
+    Entries older than fresh_ttl are still served, but trigger a background
+    refresh if the budget allows: at most max_concurrent refreshes at once and
+    per_minute refreshes started per minute (token bucket).
+    """
+
+    def __init__(
+        self,
+        fresh_ttl: Optional[float] = None,
+        max_concurrent: Optional[int] = None,
+        per_minute: Optional[float] = None
+    ):
+        """
+        Args:
+            fresh_ttl: Seconds after cached_at an entry counts as fresh (TRANSCRIPT_FRESH_TTL, default 7 days)
+            max_concurrent: Concurrent background refreshes (REFRESH_MAX_CONCURRENT, default 2)
+            per_minute: Refreshes started per minute (REFRESH_PER_MINUTE, default 10)
+        """
+        self.fresh_ttl = fresh_ttl or float(os.getenv('TRANSCRIPT_FRESH_TTL', 7 * 24 * 3600))
+        self.max_concurrent = max_concurrent or int(os.getenv('REFRESH_MAX_CONCURRENT', 2))
+        self.per_minute = per_minute or float(os.getenv('REFRESH_PER_MINUTE', 10))
+        self._tokens = self.per_minute
+        self._refilled_at = time.monotonic()
+        self._refreshing = set()
+        self.stale_served = 0
+        self.started = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def is_stale(self, cached_at: Optional[int]) -> bool:
+        # Legacy objects without cached_at are treated as stale
+        return not cached_at or time.time() - cached_at > self.fresh_ttl
+
+    def try_begin(self, key: str) -> bool:
+        """Record a stale hit and reserve budget to refresh key. Call finish(key) when done."""
+        self.stale_served += 1
+        if key in self._refreshing:
+            return False
+        now = time.monotonic()
+        self._tokens = min(self.per_minute, self._tokens + (now - self._refilled_at) * self.per_minute / 60)
+        self._refilled_at = now
+        if len(self._refreshing) >= self.max_concurrent or self._tokens < 1:
+            self.skipped += 1
+            return False
+        self._tokens -= 1
+        self._refreshing.add(key)
+        self.started += 1
+        return True
+
+    def finish(self, key: str, ok: bool = True) -> None:
+        self._refreshing.discard(key)
+        if not ok:
+            self.failed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "fresh_ttl": self.fresh_ttl,
+            "stale_served": self.stale_served,
+            "refreshes_started": self.started,
+            "refreshes_skipped": self.skipped,
+            "refreshes_failed": self.failed,
+            "refreshing": len(self._refreshing)
+        }
@@ -0,0 +1,147 @@
+from typing import Any, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from youtube_transcript_api import YouTubeTranscriptApi
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPT_LANGUAGES = ['en-US', 'en', 'en-GB', 'en-CA', 'en-AU', 'en-IN']
+DEFAULT_PROXY_ENDPOINT = 'gate.smartproxy.com:10000'
+
+class TranscriptFetcher:
+    """
+    Runs blocking YouTubeTranscriptApi fetches on a dedicated thread pool.
+
+    Each proxy endpoint has its own concurrency cap; requests beyond the cap
+    wait for a slot (reported as queue depth) and every fetch has a deadline,
+    so slow proxy responses never block the event loop.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        per_proxy_limit: Optional[int] = None,
+        deadline: Optional[float] = None,
+        proxy_endpoints: Optional[List[str]] = None
+    ):
+        """
+        Args:
+            max_workers: Thread pool size (TRANSCRIPT_FETCH_WORKERS, default 8)
+            per_proxy_limit: Concurrent fetches per proxy endpoint (TRANSCRIPT_FETCH_PER_PROXY, default 4)
+            deadline: Seconds allowed per fetch, including queueing (TRANSCRIPT_FETCH_DEADLINE, default 30)
+            proxy_endpoints: host:port proxy gateways (PROXY_ENDPOINTS, comma separated)
+        """
+        self.max_workers = max_workers or int(os.getenv('TRANSCRIPT_FETCH_WORKERS', 8))
+        self.per_proxy_limit = per_proxy_limit or int(os.getenv('TRANSCRIPT_FETCH_PER_PROXY', 4))
+        self.deadline = deadline or float(os.getenv('TRANSCRIPT_FETCH_DEADLINE', 30))
+        self.proxy_endpoints = proxy_endpoints or [
+            endpoint.strip()
+            for endpoint in os.getenv('PROXY_ENDPOINTS', DEFAULT_PROXY_ENDPOINT).split(',')
+            if endpoint.strip()
+        ]
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='transcript-fetch')
+        self._slots = {endpoint: asyncio.Semaphore(self.per_proxy_limit) for endpoint in self.proxy_endpoints}
+        self._in_use = {endpoint: 0 for endpoint in self.proxy_endpoints}
+        self.waiting = 0
+        self.running = 0
+        self.max_queue_depth = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+
+    def _proxies(self, endpoint: str) -> Optional[Dict[str, str]]:
+        proxy_user = os.getenv('PROXY_USER')
+        proxy_pass = os.getenv('PROXY_PASS')
+        if not (proxy_user and proxy_pass):
+            logger.warning("Proxy credentials not set in environment variables")
+            return None
+        return {
+            "http": f"http://{proxy_user}:{proxy_pass}@{endpoint}",
+            "https": f"https://{proxy_user}:{proxy_pass}@{endpoint}"
+        }
+
+    def _pick_endpoint(self) -> str:
+        """Least-loaded proxy endpoint (queued + running fetches)."""
+        return min(self.proxy_endpoints, key=lambda endpoint: self._in_use[endpoint])
+
+    async def fetch(self, video_id: str) -> list:
+        """
+        Fetch a transcript on the thread pool.
+
+        Args:
+            video_id: YouTube video ID
+
+        Returns:
+            List of transcript entries
+
+        Raises:
+            TimeoutError: If the fetch (including time spent queued) exceeds the deadline
+            TranscriptsDisabled, NoTranscriptFound: Propagated from YouTubeTranscriptApi
+        """
+        endpoint = self._pick_endpoint()
+        slot = self._slots[endpoint]
+        proxies = self._proxies(endpoint)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+
+        self._in_use[endpoint] += 1
+        self.waiting += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.waiting)
+        acquired = False
+        future = None
+        try:
+            try:
+                async with asyncio.timeout_at(deadline):
+                    await slot.acquire()
+            finally:
+                self.waiting -= 1
+            acquired = True
+            self.running += 1
+            logger.info(f"Fetching transcript for video ID {video_id} via {endpoint}")
+            future = loop.run_in_executor(
+                self._executor,
+                lambda: YouTubeTranscriptApi.get_transcript(video_id, languages=TRANSCRIPT_LANGUAGES, proxies=proxies)
+            )
+            async with asyncio.timeout_at(deadline):
+                transcript = await asyncio.shield(future)
+            self.completed += 1
+            return transcript
+        except TimeoutError:
+            self.timed_out += 1
+            logger.error(f"Transcript fetch for video ID {video_id} exceeded {self.deadline}s deadline")
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            if future is not None and not future.done():
+                # The worker thread cannot be interrupted; keep its slot
+                # occupied until it actually finishes so the cap stays honest.
+                future.add_done_callback(lambda _: self._release(endpoint))
+            elif acquired:
+                self._release(endpoint)
+            else:
+                self._in_use[endpoint] -= 1
+
+    def _release(self, endpoint: str) -> None:
+        self.running -= 1
+        self._in_use[endpoint] -= 1
+        self._slots[endpoint].release()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.max_workers,
+            "per_proxy_limit": self.per_proxy_limit,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_queue_depth,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "in_use_by_endpoint": dict(self._in_use)
+        }
@@ -0,0 +1,103 @@
+from typing import Any, Dict, List
+from array import array
+import gzip
+import hashlib
+import json
+import struct
+import sys
+import zlib
+
+# Binary transcript cache format, version 1:
+#
+#   header   magic b'YTT\x01' | flags u8 | count u32 | cached_at u64   (little endian)
+#   payload  zlib(starts f64[count] | durations f64[count] | text offsets u32[count + 1] | utf-8 text blob)
+#
+# Text offsets index characters of the decoded text blob, so the whole blob is
+# decoded once and each entry is a plain str slice. Objects that do not start
+# with the magic are legacy JSON documents of the form
+# {"transcript": [...], "cached_at": ...}. The flags byte is reserved (0).
+
+MAGIC = b'YTT\x01'
+CONTENT_TYPE = 'application/x-youtube-transcript'
+
+_HEADER = struct.Struct('<4sBIQ')
+
+def _to_little_endian(values: array) -> array:
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+def encode_transcript(transcript: List[Dict[str, Any]], cached_at: int = 0) -> bytes:
+    """
+    Encode transcript entries into the compact binary cache format.
+
+    Args:
+        transcript: List of {text, start, duration} entries
+        cached_at: Unix timestamp stored in the header
+
+    Returns:
+        Encoded bytes
+    """
+    starts = array('d', [entry['start'] for entry in transcript])
+    durations = array('d', [entry.get('duration', 0) for entry in transcript])
+    offsets = array('I', [0])
+    for entry in transcript:
+        offsets.append(offsets[-1] + len(entry['text']))
+    text_blob = ''.join(entry['text'] for entry in transcript).encode('utf-8')
+
+    payload = b''.join([
+        _to_little_endian(starts).tobytes(),
+        _to_little_endian(durations).tobytes(),
+        _to_little_endian(offsets).tobytes(),
+        text_blob
+    ])
+    return _HEADER.pack(MAGIC, 0, len(transcript), int(cached_at)) + zlib.compress(payload, 6)
+
+def decode_transcript(body: bytes) -> Dict[str, Any]:
+    """
+    Decode a cached transcript object, binary or legacy JSON.
+
+    Args:
+        body: Raw object bytes from the cache
+
+    Returns:
+        {"transcript": [...], "cached_at": int or None}
+    """
+    if not body.startswith(MAGIC):
+        data = json.loads(body.decode('utf-8'))
+        return {"transcript": data['transcript'], "cached_at": data.get('cached_at')}
+
+    _, _, count, cached_at = _HEADER.unpack_from(body)
+    payload = zlib.decompress(body[_HEADER.size:])
+
+    starts, durations, offsets = array('d'), array('d'), array('I')
+    position = 0
+    for column, length in ((starts, count), (durations, count), (offsets, count + 1)):
+        end = position + length * column.itemsize
+        column.frombytes(payload[position:end])
+        _to_little_endian(column)
+        position = end
+
+    text = payload[position:].decode('utf-8')
+    offsets = offsets.tolist()
+    transcript = [
+        {'text': text[begin:end], 'start': start, 'duration': duration}
+        for begin, end, start, duration in zip(offsets, offsets[1:], starts.tolist(), durations.tolist())
+    ]
+    return {"transcript": transcript, "cached_at": cached_at or None}
+
+def estimate_size(transcript: List[Dict[str, Any]]) -> int:
+    """Approximate uncompressed size in bytes, used to charge in-memory caches."""
+    return sum(len(entry['text']) + 48 for entry in transcript)
+
+def encode_response(transcript: List[Dict[str, Any]]) -> bytes:
+    """
+    Gzip-compressed /transcript response body, stored so cache hits can be
+    sent to the client without decoding and re-encoding the transcript.
+    """
+    # mtime=0 keeps the bytes (and so the ETag) identical for identical transcripts
+    return gzip.compress(json.dumps({"transcript": transcript}).encode('utf-8'), 6, mtime=0)
+
+def content_etag(body: bytes) -> str:
+    """Strong ETag for stored bytes; matches the ETag S3 assigns to a single-part upload."""
+    return f'"{hashlib.md5(body).hexdigest()}"'
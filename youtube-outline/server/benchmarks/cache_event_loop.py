@@ -0,0 +1,133 @@
+"""
+Event-loop latency under concurrent transcript cache hits.
+
+Runs a local S3 stand-in with a fixed per-request delay, then issues concurrent
+cache reads through the old synchronous boto3 client and the async
+S3TranscriptCache while a heartbeat task measures how late the loop wakes up.
+
+Usage (from the server directory):
+    python -m benchmarks.cache_event_loop --requests 200 --latency-ms 20
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import threading
+import time
+
+import boto3
+from botocore.config import Config
+
+from app.transcript_cache import S3TranscriptCache
+
+BUCKET = 'youtube-transcripts-cache'
+
+class FakeS3Handler(BaseHTTPRequestHandler):
+    """Minimal path-style S3 GET/PUT object handler backed by a dict."""
+    objects = {}
+    latency = 0.02
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        body = self.objects.get(urlparse(self.path).path)
+        if body is None:
+            error = b'<?xml version="1.0"?><Error><Code>NoSuchKey</Code><Message>Not found</Message></Error>'
+            self.send_response(404)
+            self.send_header('Content-Type', 'application/xml')
+            self.send_header('Content-Length', str(len(error)))
+            self.end_headers()
+            self.wfile.write(error)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', '"bench"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_PUT(self):
+        time.sleep(self.latency)
+        length = int(self.headers.get('Content-Length', 0))
+        self.objects[urlparse(self.path).path] = self.rfile.read(length)
+        self.send_response(200)
+        self.send_header('ETag', '"bench"')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+async def heartbeat(stop: asyncio.Event, lags: list, interval: float = 0.005):
+    """Record how late the loop wakes up relative to the requested sleep."""
+    while not stop.is_set():
+        before = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - before - interval) * 1000)
+
+async def run_scenario(name: str, fetch, keys: list) -> None:
+    stop = asyncio.Event()
+    lags = []
+    ticker = asyncio.create_task(heartbeat(stop, lags))
+    started = time.perf_counter()
+    await asyncio.gather(*[fetch(key) for key in keys])
+    wall = time.perf_counter() - started
+    stop.set()
+    await ticker
+    lags.sort()
+    p99 = lags[int(len(lags) * 0.99) - 1] if len(lags) > 1 else lags[0]
+    print(f"{name:<12} wall={wall * 1000:8.1f}ms  loop lag p50={statistics.median(lags):7.2f}ms  "
+          f"p99={p99:7.2f}ms  max={lags[-1]:7.2f}ms  ticks={len(lags)}")
+
+async def main(args):
+    transcript = [{'text': f'line {i}', 'start': i * 2.5, 'duration': 2.5} for i in range(2000)]
+    body = json.dumps({'transcript': transcript, 'cached_at': int(time.time())}).encode('utf-8')
+    keys = [f"video{i % args.videos}.json" for i in range(args.requests)]
+    for i in range(args.videos):
+        FakeS3Handler.objects[f"/{BUCKET}/video{i}.json"] = body
+
+    sync_client = boto3.client(
+        's3',
+        endpoint_url=os.environ['S3_ENDPOINT_URL'],
+        config=Config(s3={'addressing_style': 'path'}, max_pool_connections=args.pool)
+    )
+
+    async def sync_fetch(key):
+        # Previous behaviour: blocking boto3 call inside an async function
+        response = sync_client.get_object(Bucket=BUCKET, Key=key)
+        return json.loads(response['Body'].read())
+
+    cache = S3TranscriptCache(max_connections=args.pool, timeout=30)
+    await cache.start()
+
+    async def async_fetch(key):
+        return json.loads(await cache.get(key))
+
+    print(f"{args.requests} concurrent hits over {args.videos} videos, "
+          f"{args.latency_ms}ms simulated S3 latency, pool={args.pool}")
+    await run_scenario('sync boto3', sync_fetch, keys)
+    await run_scenario('aiobotocore', async_fetch, keys)
+    await cache.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--videos', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--pool', type=int, default=20)
+    args = parser.parse_args()
+
+    FakeS3Handler.latency = args.latency_ms / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeS3Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ['S3_ENDPOINT_URL'] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+    os.environ.setdefault('AWS_REGION', 'us-east-1')
+    try:
+        asyncio.run(main(args))
+    finally:
+        server.shutdown()
@@ -0,0 +1,160 @@
+"""
+Per-turn chat latency: clients built per request vs shared, pooled clients.
+
+per-request: what generate_chat_response used to do on every message: build
+             VectorDB() (load_dotenv, Pinecone, OpenAIEmbeddings), open the
+             index, embed and query synchronously, then build a new
+             ChatOpenAI and run invoke in a thread
+shared:      generate_chat_response with the app-scoped clients from
+             app/llm_clients.py
+
+Both run against a local stand-in server that answers the OpenAI embeddings
+and chat completions APIs and the Pinecone query API. Every new connection
+waits --connect-ms before it is served, standing in for the TCP and TLS
+handshakes to the real services, and every request takes --latency-ms.
+Reports turn latency for sequential turns and for bursts of concurrent turns
+(blocking calls on the event loop serialize those), and the number of
+connections each mode opened after one warm-up turn.
+
+Usage (from the server directory):
+    OPENAI_API_KEY=x python -m benchmarks.chat_clients [--turns 30] [--concurrency 8]
+        [--connect-ms 60] [--latency-ms 30]
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+
+class StandIn:
+    """Minimal HTTP/1.1 keep-alive server for the OpenAI and Pinecone endpoints chat uses."""
+
+    def __init__(self, connect_delay: float, latency: float):
+        self.connect_delay = connect_delay
+        self.latency = latency
+        self.connections = 0
+
+    def body(self, path: str) -> dict:
+        if path.endswith('/embeddings'):
+            return {
+                'object': 'list', 'model': 'text-embedding-3-small',
+                'data': [{'object': 'embedding', 'index': 0, 'embedding': [0.01] * 1536}],
+                'usage': {'prompt_tokens': 8, 'total_tokens': 8}
+            }
+        if path.endswith('/chat/completions'):
+            return {
+                'id': 'chatcmpl-bench', 'object': 'chat.completion', 'created': int(time.time()), 'model': 'gpt-4o',
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': 'The speaker covers three main points.'}}],
+                'usage': {'prompt_tokens': 400, 'completion_tokens': 8, 'total_tokens': 408}
+            }
+        # Pinecone data plane: /query
+        return {
+            'namespace': '',
+            'matches': [
+                {'id': str(i), 'score': 0.9 - i / 10, 'metadata': {'text': f'transcript chunk {i} ' * 40, 'video_id': 'bench'}}
+                for i in range(5)
+            ]
+        }
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        await asyncio.sleep(self.connect_delay)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b''):
+                    name, _, value = line.decode().partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                await reader.readexactly(int(headers.get('content-length', 0)))
+                await asyncio.sleep(self.latency)
+                payload = json.dumps(self.body(request_line.split()[1].decode())).encode()
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                             b'Content-Length: ' + str(len(payload)).encode() + b'\r\n\r\n' + payload)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+def serve_in_thread(stand_in: StandIn) -> str:
+    """Run the stand-in on its own event loop, so blocking client calls cannot stall it."""
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(asyncio.start_server(stand_in.handle, '127.0.0.1', 0))
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))] * 1000
+
+async def main(args, server_stand_in: StandIn, host: str):
+    os.environ['OPENAI_BASE_URL'] = f"{host}/v1"
+    os.environ['PINECONE_API_KEY'] = 'x'
+    os.environ['PINECONE_INDEX_HOST'] = host
+
+    # Imported after the environment points the clients at the stand-in
+    from langchain_openai import ChatOpenAI
+    from app.chat_transcript import generate_chat_response
+    from app.llm_clients import llm_clients
+    from app.llm_scheduler import llm_scheduler
+    from app.rag.vector_db import VectorDB
+
+    llm_scheduler.requests_per_minute = llm_scheduler.tokens_per_minute = 10 ** 9
+    llm_scheduler.max_concurrent = args.concurrency * 2
+
+    async def per_request_turn(message: str) -> None:
+        vector_db = VectorDB()
+        # The stand-in does not tokenize; skip tiktoken in both modes
+        vector_db.embeddings.check_embedding_ctx_length = False
+        query_embedding = vector_db.embeddings.embed_query(message)
+        results = vector_db.pc.Index(vector_db.index_name, host=vector_db.index_host).query(
+            vector=query_embedding, filter={"video_id": "bench"}, top_k=5, include_metadata=True
+        )
+        prompt = "\n".join(match.metadata.get("text", "") for match in results.matches) + message
+        llm = ChatOpenAI(model="gpt-4o", temperature=0.7, openai_api_key=os.getenv("OPENAI_API_KEY"))
+        await llm_scheduler.run("chat", lambda: asyncio.to_thread(llm.invoke, prompt))
+
+    async def shared_turn(message: str) -> None:
+        llm_clients.embeddings().check_embedding_ctx_length = False
+        await generate_chat_response(message, "bench")
+
+    print(f"Stand-in: {args.connect_ms:g}ms per new connection, {args.latency_ms:g}ms per request")
+    print(f"{'mode':<12} {'sequential p50':>15} {'p95':>8} {'concurrent p50':>15} {'p95':>8} {'connections':>12}")
+    for label, turn in (('per-request', per_request_turn), ('shared', shared_turn)):
+        llm_clients.start()
+        # One unmeasured turn: imports, tokenizer loading and the first connections
+        await turn("Warm up")
+        server_stand_in.connections = 0
+        sequential = []
+        for i in range(args.turns):
+            started = time.monotonic()
+            await turn(f"What is point {i}?")
+            sequential.append(time.monotonic() - started)
+
+        async def timed(message: str) -> float:
+            started = time.monotonic()
+            await turn(message)
+            return time.monotonic() - started
+
+        concurrent = []
+        for _ in range(max(1, args.turns // args.concurrency)):
+            concurrent += await asyncio.gather(*[timed(f"Question {i}") for i in range(args.concurrency)])
+        print(f"{label:<12} {percentile(sequential, 0.5):>13.1f}ms {percentile(sequential, 0.95):>6.1f}ms "
+              f"{percentile(concurrent, 0.5):>13.1f}ms {percentile(concurrent, 0.95):>6.1f}ms "
+              f"{server_stand_in.connections:>12}")
+        await llm_clients.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--turns', type=int, default=30)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--connect-ms', type=float, default=60, help="Simulated TCP+TLS handshake per new connection")
+    parser.add_argument('--latency-ms', type=float, default=30, help="Simulated service time per request")
+    args = parser.parse_args()
+    server_stand_in = StandIn(args.connect_ms / 1000, args.latency_ms / 1000)
+    asyncio.run(main(args, server_stand_in, serve_in_thread(server_stand_in)))
@@ -0,0 +1,59 @@
+"""
+Tail latency of outline-style bursts of LLM calls, with and without hedging.
+
+Simulated calls take 1-3s, except a fraction of stragglers that take much
+longer (slow OpenAI responses). Each outline is a burst of parallel segment
+calls and finishes when its slowest call does, so stragglers set outline
+latency. Runs the same bursts through LLMScheduler.run and run_hedged.
+
+Usage (from the server directory):
+    OPENAI_API_KEY=x python -m benchmarks.llm_hedging [--outlines 20] [--segments 30]
+        [--straggler-rate 0.03] [--percentile 0.9] [--max-fraction 0.1]
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from app.llm_scheduler import LLMScheduler
+
+async def main(args):
+    scheduler = LLMScheduler(max_concurrent=args.segments * 2, requests_per_minute=100000, tokens_per_minute=10 ** 9)
+    scheduler.hedging = True
+    scheduler.hedge_percentile = args.percentile
+    scheduler.hedge_max_fraction = args.max_fraction
+    rng = random.Random(0)
+
+    async def call():
+        straggler = rng.random() < args.straggler_rate
+        await asyncio.sleep((rng.uniform(8, 15) if straggler else rng.uniform(1, 3)) * args.scale)
+
+    # Warm up latency samples so the hedge threshold is known
+    await asyncio.gather(*[scheduler.run('summary', call, 1000) for _ in range(50)])
+
+    for label, runner in (('plain', scheduler.run), ('hedged', scheduler.run_hedged)):
+        outline_latencies = []
+        for _ in range(args.outlines):
+            started = time.monotonic()
+            await asyncio.gather(*[runner('summary', call, 1000) for _ in range(args.segments)])
+            outline_latencies.append((time.monotonic() - started) / args.scale)
+        outline_latencies.sort()
+        p50 = outline_latencies[len(outline_latencies) // 2]
+        p99 = outline_latencies[min(len(outline_latencies) - 1, int(0.99 * len(outline_latencies)))]
+        print(f"{label:<7} outline latency p50 {p50:6.2f}s  p99 {p99:6.2f}s  (simulated seconds)")
+
+    stats = scheduler.stats()['endpoints']['summary']
+    calls = args.outlines * args.segments
+    print(f"hedges {stats['hedges']} ({stats['hedges'] / calls:.1%} extra calls), "
+          f"hedge wins {stats['hedge_wins']}, primary wins {stats['primary_wins_after_hedge']}, "
+          f"skipped over budget {stats['hedges_skipped_over_budget']}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--outlines', type=int, default=20)
+    parser.add_argument('--segments', type=int, default=30)
+    parser.add_argument('--straggler-rate', type=float, default=0.03)
+    parser.add_argument('--percentile', type=float, default=0.9)
+    parser.add_argument('--max-fraction', type=float, default=0.1)
+    parser.add_argument('--scale', type=float, default=0.02, help="Real seconds per simulated second")
+    asyncio.run(main(parser.parse_args()))
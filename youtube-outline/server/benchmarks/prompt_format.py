@@ -0,0 +1,88 @@
+"""
+Prompt tokens per video: full vs compact transcript serialization.
+
+full:    "[12.345s] text" before every caption entry (the previous format)
+compact: normalized caption text with an integer "[12]" anchor every
+         PROMPT_ANCHOR_INTERVAL seconds (app/segmentation.py)
+
+For each transcript, reports the transcript tokens sent across all chapter
+calls and the number of calls at the token budget in each format, and checks
+that every compact anchor resolves back to the exact start of a transcript
+entry. Pass saved transcripts (JSON files with a "transcript" list, e.g.
+objects downloaded from the cache bucket) to measure real videos; otherwise
+synthetic transcripts with auto-caption filler and [Music] tags are used.
+
+Usage (from the server directory):
+    OPENAI_API_KEY=x python -m benchmarks.prompt_format [--budget 4000] [--interval 30] [transcript.json ...]
+"""
+import argparse
+import json
+import random
+import re
+
+import app.segmentation as segmentation
+from app.segmentation import count_tokens, resolve_timestamp, segment_text, split_by_tokens, token_counter
+from benchmarks.transcript_format import synthetic_transcript
+
+FILLER = ["um", "uh", "um,", "uh,", "hmm"]
+
+def captioned_transcript(hours: float) -> list:
+    """synthetic_transcript with the filler words, tags and spacing auto-captions contain."""
+    rng = random.Random(hours)
+    transcript = []
+    for entry in synthetic_transcript(hours):
+        words = entry['text'].split()
+        for _ in range(rng.randint(0, 2)):
+            words.insert(rng.randint(0, len(words)), rng.choice(FILLER))
+        text = " ".join(words)
+        if rng.random() < 0.03:
+            text = "[Music]" if rng.random() < 0.5 else f"[Music] {text}"
+        elif rng.random() < 0.2:
+            text = text.replace(" ", "\n", 1)
+        transcript.append({**entry, 'text': text})
+    return transcript
+
+def measure(transcript: list, budget: int, prompt_format: str) -> dict:
+    # split_by_tokens counts entries as segment_text renders them in the configured format
+    segmentation.PROMPT_FORMAT = prompt_format
+    segments = split_by_tokens(transcript, budget)
+    return {
+        'calls': len(segments),
+        'tokens': sum(count_tokens(segment_text(segment)) for segment in segments),
+        'segments': segments
+    }
+
+def unresolved_anchors(segments: list) -> int:
+    """Compact anchors that do not map back to an entry starting in that second."""
+    missing = 0
+    for segment in segments:
+        for value in re.findall(r"\[(\d+)\]", segment_text(segment, 'compact')):
+            if int(resolve_timestamp(float(value), segment)) != int(value):
+                missing += 1
+    return missing
+
+def report(name: str, transcript: list, budget: int) -> None:
+    full = measure(transcript, budget, 'full')
+    compact = measure(transcript, budget, 'compact')
+    reduction = 1 - compact['tokens'] / full['tokens']
+    print(f"{name:<28} {len(transcript):>7} {full['tokens']:>10} {compact['tokens']:>10} {reduction:>9.1%} "
+          f"{full['calls']:>6} -> {compact['calls']:<5} {unresolved_anchors(compact['segments']):>10}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget', type=int, default=4000)
+    parser.add_argument('--interval', type=float, default=segmentation.PROMPT_ANCHOR_INTERVAL)
+    parser.add_argument('transcripts', nargs='*')
+    args = parser.parse_args()
+    segmentation.PROMPT_ANCHOR_INTERVAL = args.interval
+
+    print(f"Anchor every {args.interval:g}s, {args.budget} tokens per call "
+          f"({'estimated' if token_counter().estimated else 'tiktoken'} counts)")
+    print(f"{'transcript':<28} {'entries':>7} {'full':>10} {'compact':>10} {'reduction':>9} {'calls':>14} {'unresolved':>10}")
+    if args.transcripts:
+        for path in args.transcripts:
+            with open(path) as f:
+                report(path, json.load(f)['transcript'], args.budget)
+    else:
+        for hours in (0.5, 1, 3, 6):
+            report(f"synthetic captions {hours}h", captioned_transcript(hours), args.budget)
@@ -0,0 +1,83 @@
+"""
+LLM calls and tokens per call: equal-time splitter vs token-budgeted packing.
+
+For each transcript, reports the number of calls, prompt tokens per call
+(transcript plus the chapter prompt template) and how many calls exceed the
+token budget under the time splitter. Pass saved transcripts (JSON files with
+a "transcript" list, e.g. objects downloaded from the cache bucket) to
+benchmark a corpus of real videos; otherwise synthetic transcripts with
+alternating fast-talking and quiet stretches are used.
+
+Token counts use tiktoken; if its encoding cannot be downloaded the
+character-based estimate from app/segmentation.py is used and reported.
+
+Usage (from the server directory):
+    OPENAI_API_KEY=x python -m benchmarks.segmentation [--budget 4000] [transcript.json ...]
+"""
+import argparse
+import json
+import random
+import statistics
+
+from app.segmentation import count_tokens, segment_text, split_by_tokens, token_counter
+from app.summary_generator import CHAPTER_SUMMARY_PROMPT, calculate_target_segments, split_transcript
+from benchmarks.transcript_format import WORDS
+
+def bursty_transcript(hours: float) -> list:
+    """Synthetic transcript alternating ~10 minute fast-talking and quiet stretches."""
+    rng = random.Random(hours)
+    transcript = []
+    start = 0.0
+    while start < hours * 3600:
+        fast = int(start // 600) % 2 == 0
+        words = rng.randint(18, 30) if fast else rng.randint(2, 6)
+        duration = round(rng.uniform(2.0, 4.0), 3)
+        transcript.append({
+            'text': " ".join(rng.choice(WORDS) for _ in range(words)),
+            'start': round(start, 3),
+            'duration': duration
+        })
+        start += duration + (0.1 if fast else rng.uniform(2.0, 8.0))
+    return transcript
+
+def describe(segments: list, budget: int) -> dict:
+    template_tokens = count_tokens(CHAPTER_SUMMARY_PROMPT.format(text_content=""))
+    transcript_tokens = [count_tokens(segment_text(segment)) for segment in segments]
+    return {
+        'calls': len(segments),
+        'min': min(transcript_tokens),
+        'median': int(statistics.median(transcript_tokens)),
+        'max': max(transcript_tokens),
+        'over_budget': sum(tokens > budget for tokens in transcript_tokens),
+        'prompt_tokens': sum(transcript_tokens) + template_tokens * len(segments)
+    }
+
+def report(name: str, transcript: list, budget: int) -> None:
+    last_entry = transcript[-1]
+    total_duration = last_entry['start'] + last_entry.get('duration', 0)
+    rows = [
+        ('time', split_transcript(transcript, calculate_target_segments(total_duration))),
+        ('tokens', split_by_tokens(transcript, budget, snap_to_pauses=False)),
+        ('tokens+pauses', split_by_tokens(transcript, budget, snap_to_pauses=True))
+    ]
+    print(f"\n{name}: {len(transcript)} entries, {total_duration / 3600:.1f}h")
+    print(f"  {'splitter':<14} {'calls':>6} {'min':>7} {'median':>7} {'max':>7} {'>budget':>8} {'prompt tokens':>14}")
+    for label, segments in rows:
+        stats = describe(segments, budget)
+        print(f"  {label:<14} {stats['calls']:>6} {stats['min']:>7} {stats['median']:>7} {stats['max']:>7} "
+              f"{stats['over_budget']:>8} {stats['prompt_tokens']:>14}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget', type=int, default=4000)
+    parser.add_argument('transcripts', nargs='*')
+    args = parser.parse_args()
+
+    print(f"Token budget per call: {args.budget} ({'estimated' if token_counter().estimated else 'tiktoken'} counts)")
+    if args.transcripts:
+        for path in args.transcripts:
+            with open(path) as f:
+                report(path, json.load(f)['transcript'], args.budget)
+    else:
+        for hours in (0.5, 1, 3, 6):
+            report(f"synthetic bursty {hours}h", bursty_transcript(hours), args.budget)
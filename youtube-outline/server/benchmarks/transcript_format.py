@@ -0,0 +1,65 @@
+"""
+Size and decode time of the transcript cache formats on long transcripts.
+
+Compares the legacy JSON object, gzip-compressed JSON and the binary v1
+format from app/transcript_format.py. Pass saved transcripts (JSON files with
+a "transcript" list, e.g. objects downloaded from the cache bucket) to
+benchmark real videos; otherwise synthetic 1h/3h/6h transcripts are used.
+
+Usage (from the server directory):
+    python -m benchmarks.transcript_format [transcript.json ...]
+"""
+import gzip
+import json
+import random
+import sys
+import time
+
+from app.transcript_format import encode_transcript, decode_transcript
+
+WORDS = ("so the thing is we want to think about how this model actually learns "
+         "and what that means for the rest of the system you know basically right").split()
+
+def synthetic_transcript(hours: float) -> list:
+    rng = random.Random(hours)
+    transcript = []
+    start = 0.0
+    while start < hours * 3600:
+        duration = round(rng.uniform(1.5, 5.0), 3)
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 14)))
+        transcript.append({'text': text, 'start': round(start, 3), 'duration': duration})
+        start += rng.uniform(1.5, 4.0)
+    return transcript
+
+def best_of(fn, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+def report(name: str, transcript: list) -> None:
+    legacy = json.dumps({'transcript': transcript, 'cached_at': 0}).encode('utf-8')
+    gzipped = gzip.compress(legacy, 6)
+    binary = encode_transcript(transcript)
+    assert decode_transcript(binary)['transcript'] == decode_transcript(legacy)['transcript']
+
+    print(f"\n{name}: {len(transcript)} entries")
+    print(f"  {'format':<12} {'bytes':>10} {'ratio':>7} {'decode ms':>10}")
+    rows = [
+        ('json', legacy, lambda: decode_transcript(legacy)),
+        ('json+gzip', gzipped, lambda: decode_transcript(gzip.decompress(gzipped))),
+        ('binary v1', binary, lambda: decode_transcript(binary))
+    ]
+    for label, body, decode in rows:
+        print(f"  {label:<12} {len(body):>10} {len(body) / len(legacy):>7.2f} {best_of(decode):>10.2f}")
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        for path in sys.argv[1:]:
+            with open(path) as f:
+                report(path, json.load(f)['transcript'])
+    else:
+        for hours in (1, 3, 6):
+            report(f"synthetic {hours}h", synthetic_transcript(hours))
@@ -0,0 +1,53 @@
+"""
+CPU time per /transcript cache hit, before and after pass-through serving.
+
+before:       decode the cached object, return a dict and let FastAPI encode it
+after (gzip): send the stored gzipped response body as-is
+after (raw):  gunzip the stored body for clients without gzip support
+
+Usage (from the server directory):
+    python -m benchmarks.transcript_response_cpu [--hours 1 3 6] [--iterations 50]
+"""
+import argparse
+import gzip
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+from app.transcript_format import encode_transcript, decode_transcript, encode_response
+from benchmarks.transcript_format import synthetic_transcript
+
+def cpu_ms_per_call(fn, iterations: int) -> float:
+    started = time.process_time()
+    for _ in range(iterations):
+        fn()
+    return (time.process_time() - started) * 1000 / iterations
+
+def main(args):
+    print(f"{'transcript':<12} {'before':>10} {'after gzip':>11} {'after raw':>10}   (CPU ms per hit)")
+    for hours in args.hours:
+        transcript = synthetic_transcript(hours)
+        stored = encode_transcript(transcript)
+        stored_response = encode_response(transcript)
+
+        def before():
+            data = decode_transcript(stored)
+            # What FastAPI does with a returned dict: jsonable_encoder, then JSONResponse.render
+            JSONResponse(content=jsonable_encoder({"transcript": data['transcript']})).body
+
+        def after_gzip():
+            Response(stored_response, media_type='application/json', headers={'Content-Encoding': 'gzip'})
+
+        def after_raw():
+            Response(gzip.decompress(stored_response), media_type='application/json')
+
+        print(f"{f'{hours}h':<12} {cpu_ms_per_call(before, args.iterations):>10.2f} "
+              f"{cpu_ms_per_call(after_gzip, args.iterations):>11.3f} "
+              f"{cpu_ms_per_call(after_raw, args.iterations):>10.2f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hours', type=float, nargs='+', default=[1, 3, 6])
+    parser.add_argument('--iterations', type=int, default=50)
+    main(parser.parse_args())
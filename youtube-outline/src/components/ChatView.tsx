@@ -1,12 +1,22 @@
-import React, { useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { useViews } from '../contexts/ViewsContext';
+import { ChatSource } from '../types/types';
+import { formatTime } from '../utils/utils';
 
 interface ChatMessage {
   id: string;
   text: string;
   isAI: boolean;
+  sources?: ChatSource[];
 }
 
+// One server-sent event from /chat/stream
+type ChatStreamEvent =
+  | { type: 'context'; chunks: ChatSource[] }
+  | { type: 'token'; text: string }
+  | { type: 'done'; answer: string }
+  | { type: 'error'; detail: string };
+
 interface ChatViewProps {
   playerRef: React.MutableRefObject<any>;
   videoId: string;
@@ -20,6 +30,14 @@ const ChatView: React.FC<ChatViewProps> = ({
   const [isGenerating, setIsGenerating] = useState(false);
   const [inputMessage, setInputMessage] = useState('');
   const [error, setError] = useState<string | null>(null);
+  // Aborting the request closes the stream, which cancels generation on the server
+  const abortRef = useRef<AbortController | null>(null);
+
+  useEffect(() => () => abortRef.current?.abort(), []);
+
+  const updateAIMessage = (id: string, update: (message: ChatMessage) => ChatMessage) => {
+    setMessages(prevMessages => prevMessages.map(message => message.id === id ? update(message) : message));
+  };
 
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault();
@@ -54,34 +72,60 @@ const ChatView: React.FC<ChatViewProps> = ({
         video_id: videoId
       });
       
-      const response = await fetch('http://localhost:8000/chat', {
+      const controller = new AbortController();
+      abortRef.current = controller;
+      const response = await fetch('http://localhost:8000/chat/stream', {
         method: 'POST',
         headers: { 
           'Content-Type': 'application/json',
-          'Accept': 'application/json'
+          'Accept': 'text/event-stream'
         },
         body: JSON.stringify({
           messages: recentMessages,
           video_id: videoId
-        })
+        }),
+        signal: controller.signal
       });
       
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error('Failed to get response');
       }
       
       console.log('Response status:', response.status);
-      const data = await response.json();
-      console.log('Response data:', data);
       
-      // Add AI response
-      const aiMessage: ChatMessage = {
-        id: Date.now().toString(),
-        text: data.answer.answer,  // Access the nested answer field
-        isAI: true
-      };
-      setMessages(prevMessages => [...prevMessages, aiMessage]);
+      // Add the AI message now and fill it in as tokens arrive
+      const aiMessageId = `${Date.now()}-ai`;
+      setMessages(prevMessages => [...prevMessages, { id: aiMessageId, text: '', isAI: true }]);
+      
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        // Events are separated by a blank line; keep any partial event for the next read
+        const frames = buffer.split('\n\n');
+        buffer = frames.pop() ?? '';
+        for (const frame of frames) {
+          const data = frame.split('\n').find(line => line.startsWith('data: '));
+          if (!data) continue;
+          const event: ChatStreamEvent = JSON.parse(data.slice('data: '.length));
+          if (event.type === 'context') {
+            updateAIMessage(aiMessageId, message => ({ ...message, sources: event.chunks }));
+          } else if (event.type === 'token') {
+            updateAIMessage(aiMessageId, message => ({ ...message, text: message.text + event.text }));
+          } else if (event.type === 'done') {
+            updateAIMessage(aiMessageId, message => ({ ...message, text: event.answer }));
+          } else if (event.type === 'error') {
+            throw new Error(event.detail);
+          }
+        }
+      }
     } catch (error) {
+      if (error instanceof DOMException && error.name === 'AbortError') return;
+      // Drop the AI message if the stream failed before any text arrived
+      setMessages(prevMessages => prevMessages.filter(message => !(message.isAI && !message.text)));
       console.error('Chat error:', error);
       if (error instanceof Error) {
         console.error('Error message:', error.message);
@@ -96,6 +140,7 @@ const ChatView: React.FC<ChatViewProps> = ({
       
       setError('Failed to get response from AI. Please try again.');
     } finally {
+      abortRef.current = null;
       setIsGenerating(false);
     }
   };
@@ -119,11 +164,28 @@ const ChatView: React.FC<ChatViewProps> = ({
                 }`}
               >
                 {message.text}
+                {message.sources?.some(source => source.start !== null) && (
+                  <div className="flex flex-wrap gap-1 mt-2">
+                    {message.sources
+                      .filter(source => source.start !== null)
+                      .map((source, index) => (
+                        <button
+                          key={index}
+                          type="button"
+                          title={source.text}
+                          onClick={() => playerRef.current?.seekTo(source.start)}
+                          className="text-xs text-blue-600 bg-white rounded px-2 py-0.5 hover:bg-blue-50"
+                        >
+                          {formatTime(source.start!)}
+                        </button>
+                      ))}
+                  </div>
+                )}
               </div>
             </div>
           ))
         )}
-        {isGenerating && (
+        {isGenerating && !messages[messages.length - 1]?.isAI && (
           <p className="text-gray-600">Generating response...</p>
         )}
         {error && (
@@ -1,5 +1,6 @@
 import React, { useState } from 'react';
 import { QuizQuestion, TranscriptSegment } from '../types/types';
+import { useViews } from '../contexts/ViewsContext';
 import Question from './Question';
 
 interface QuizViewProps {
@@ -7,6 +8,7 @@ interface QuizViewProps {
 }
 
 export default function QuizView({ transcript }: QuizViewProps) {
+  const { outline } = useViews();
   const [questions, setQuestions] = useState<QuizQuestion[]>([]);
   const [selectedAnswers, setSelectedAnswers] = useState<Record<number, number>>({});
   const [showResults, setShowResults] = useState(false);
@@ -38,7 +40,8 @@ export default function QuizView({ transcript }: QuizViewProps) {
       const response = await fetch(`${import.meta.env.VITE_SERVER_URL}/generate-quiz`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ transcript })
+        // Questions are built from the outline chapters when the outline has loaded
+        body: JSON.stringify({ transcript, outline: outline.length > 0 ? outline : undefined })
       });
       
       if (!response.ok) {
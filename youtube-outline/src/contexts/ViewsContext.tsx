@@ -1,5 +1,5 @@
 import React, { createContext, useContext, useState } from 'react';
-import { OutlineSegment, TranscriptSegment } from '../types/types';
+import { ChatSource, OutlineSegment, TranscriptSegment } from '../types/types';
 
 interface ViewsContextType {
   outline: OutlineSegment[];
@@ -8,6 +8,7 @@ interface ViewsContextType {
     id: string;
     text: string;
     isAI: boolean;
+    sources?: ChatSource[];
   }>;
   setMessages: (messages: ViewsContextType['messages']) => void;
   isFetchingOutline: boolean;
@@ -9,6 +9,7 @@ export interface OutlineSegment {
   start: number;
   duration: number;
   bullet_points: string[];
+  children?: OutlineSegment[];  // Merged chapters (hierarchical outlines)
 }
 
 export interface QuizQuestion {
@@ -17,3 +18,10 @@ export interface QuizQuestion {
   options: [string, string, string, string];  // Tuple of exactly 4 options
   correctAnswer: number;
 }
+
+export interface ChatSource {
+  text: string;
+  score: number;
+  start: number | null;  // Seconds; null for chunks indexed without timestamps
+  end: number | null;
+}